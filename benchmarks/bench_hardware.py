@@ -0,0 +1,107 @@
+"""
+Per-sample cost of host and process stats with procfs and psutil readers
+compared with the stats collection they replaced:
+
+    python -m benchmarks.bench_hardware [samples]
+"""
+import os
+import sys
+import timeit
+from unittest.mock import patch
+
+import psutil
+
+from optscale_arcee.collectors.hardware import (
+    Collector, CpuSampler, PsutilReader)
+from optscale_arcee.collectors.procfs import ProcfsReader
+
+
+def baseline_ps_stats():
+    """
+    Stats collection before the readers, psutil calls of the former
+    _ps_stats without its blocking measurement intervals
+    """
+    load1, load5, load15 = psutil.getloadavg()
+    cpu_load = psutil.cpu_percent(interval=None, percpu=True)
+    cpu_percent = round(sum(cpu_load) / psutil.cpu_count(), 2)
+    process = psutil.Process(os.getpid())
+    physical_mem = psutil.virtual_memory().total
+    swap_mem = psutil.swap_memory().total
+    proc_vmem = process.memory_info().vms
+    proc_rss = process.memory_info().rss
+    cpu_proc = min([
+        round(process.cpu_percent(interval=None) / psutil.cpu_count(), 2),
+        cpu_percent,
+    ])
+    ps_stats = {
+        "cpu_count": psutil.cpu_count(),
+        "cpu_percent": cpu_percent,
+        "cpu_percent_percpu": cpu_load,
+        "load_average": [load1, load5, load15],
+        "cpu_usage": (load15 / psutil.cpu_count()) * 100,
+        "used_ram_percent": psutil.virtual_memory()[2],
+        "used_ram_mb": psutil.virtual_memory()[3] / (1024 * 1024),
+    }
+    proc_stats = {
+        "cpu": cpu_proc,
+        "mem": {
+            "vms": {
+                "p": "{:.3f}".format(proc_vmem / (physical_mem + swap_mem)),
+                "t": proc_vmem,
+            },
+            "rss": {
+                "p": "{:.3f}".format(proc_rss / physical_mem),
+                "t": proc_rss,
+            },
+        },
+    }
+    return ps_stats, proc_stats
+
+
+def bench_baseline(number):
+    baseline_ps_stats()
+    seconds = min(timeit.repeat(baseline_ps_stats, number=number, repeat=5))
+    return seconds / number * 1e6
+
+
+class _NoTree:
+    @staticmethod
+    def sample(cpu_count=None):
+        return {}
+
+
+def bench(reader, number, extras):
+    """
+    :param extras: include the process tree and cgroup stats, which the
+    baseline doesn't collect
+    """
+    # the process tree takes the main process figures from the reader
+    with patch.object(Collector, "cpu_sampler", CpuSampler(reader)), \
+            patch.object(Collector, "_process_tree", None), \
+            patch.object(Collector, "cgroup",
+                         Collector.cgroup if extras else None), \
+            patch.object(Collector, "process_tree",
+                         Collector.process_tree if extras else _NoTree):
+        Collector._ps_stats()
+        seconds = min(timeit.repeat(Collector._ps_stats, number=number,
+                                    repeat=5))
+    reader.close()
+    return seconds / number * 1e6
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    baseline = bench_baseline(number)
+    print("%-30s %8.1f us/sample" % ("baseline", baseline))
+    readers = [("psutil", PsutilReader)]
+    if ProcfsReader.available():
+        readers.append(("procfs", ProcfsReader))
+    for name, reader in readers:
+        for extras, suffix in ((False, ""), (True, " + process tree, cgroup")):
+            cost = bench(reader(), number, extras)
+            print("%-30s %8.1f us/sample, %.2fx of baseline" % (
+                name + suffix, cost, cost / baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+asyncio API, functions are coroutines running on the caller's event loop:
+
+    from optscale_arcee import aio
+
+    async with await aio.init(token, task_key):
+        await aio.send({"loss": 0.1})
+"""
+import asyncio
+import atexit
+import logging
+import time
+import warnings
+from functools import partial
+
+from optscale_arcee.arcee import ArceeState
+from optscale_arcee.sender.batcher import MetricsBatcher
+from optscale_arcee.sender.retry import CircuitOpenError
+from optscale_arcee.collectors.console import (
+    acquire_console, release_console)
+from optscale_arcee.collectors.hardware import Collector as HardwareCollector
+from optscale_arcee.collectors.sampler import Sampler
+from optscale_arcee.name_generator import NameGenerator
+from optscale_arcee.utils import single
+
+LOG = logging.getLogger(__name__)
+
+
+@single
+class AsyncArcee(ArceeState):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            await finish()
+        else:
+            await error()
+        return exc_type is None
+
+
+async def _heartbeat(sender, run, token, period, sampler):
+    arcee = AsyncArcee()
+    loop = asyncio.get_running_loop()
+    next_run = loop.time()
+    while not arcee.shutdown_flag.is_set():
+        try:
+            await sender.send_proc_data(run, token, sampler)
+        except CircuitOpenError as exc:
+            LOG.debug("Heartbeat is skipped: %s", exc)
+        except Exception as exc:
+            # heartbeat keeps running until the run is finished
+            LOG.warning("Failed to send heartbeat: %r", exc)
+        next_run = max(next_run + period, loop.time())
+        await asyncio.sleep(next_run - loop.time())
+
+
+def _unhandled_finish():
+    arcee = AsyncArcee()
+    if not arcee.shutdown_flag.is_set():
+        # the event loop the run belongs to is already stopped
+        warnings.warn(
+            "Run terminated unexpectedly! Please ensure that you use "
+            "`await aio.init()` as an async context manager or explicitly "
+            "await `aio.finish()` / `aio.error()`",
+            UserWarning
+        )
+
+
+async def init(
+    token, task_key, run_name=None, endpoint_url=None, ssl=True, period=1,
+    spool_dir=None, compression=None, sample_period=None
+):
+    acquire_console()
+    arcee = AsyncArcee(
+        token, task_key, endpoint_url, ssl, spool_dir, compression)
+    name = (
+        run_name if run_name is not None else NameGenerator.get_random_name()
+    )
+    arcee.name = name
+    run_id = (await arcee.sender.get_run_id(task_key, token, name))["id"]
+    arcee.run = run_id
+    if not period or not isinstance(period, int):
+        # 1 second by default
+        period = 1
+    arcee.sampler = Sampler(sample_period)
+    arcee.sampler.start()
+    arcee.hb = asyncio.ensure_future(
+        _heartbeat(arcee.sender, run_id, token, period, arcee.sampler))
+    arcee.metrics = MetricsBatcher(
+        partial(arcee.sender.send_stats_batch, token))
+    await arcee.metrics.start()
+    atexit.register(_unhandled_finish)
+    await arcee.sender.send_stats(
+        arcee.token,
+        {"project": arcee.task_key, "run": arcee.run, "data": {}},
+    )
+    return arcee
+
+
+async def hyperparam(key, value):
+    """
+    Add hyperparameter
+    Args:
+        key: string
+        value: float
+    Returns:
+    """
+    arcee = AsyncArcee()
+    arcee.hyperparams = (key, value)
+    await arcee.sender.add_hyperparams(
+        arcee.run, arcee.token, dict(arcee.hyperparams))
+
+
+async def tag(key, value):
+    arcee = AsyncArcee()
+    arcee.tags = (key, value)
+    await arcee.sender.add_tags(arcee.run, arcee.token, dict(arcee.tags))
+
+
+async def milestone(value):
+    arcee = AsyncArcee()
+    await arcee.sender.add_milestone(arcee.run, arcee.token, value)
+
+
+async def stage(name):
+    arcee = AsyncArcee()
+    await arcee.sender.create_stage(arcee.run, arcee.token, name)
+
+
+async def dataset(path, name=None, description=None, labels=None):
+    arcee = AsyncArcee()
+    if arcee.dataset is None:
+        arcee.dataset = path
+        await arcee.sender.register_dataset(
+            arcee.token, arcee.run, arcee.name, arcee.task_key, path, name,
+            description, labels
+        )
+
+
+async def _shutdown(state):
+    release_console()
+    arcee = AsyncArcee()
+    if arcee.metrics is not None:
+        await arcee.metrics.stop()
+    try:
+        await arcee.sender.send_console(arcee.run, arcee.token)
+    except Exception:
+        pass
+    try:
+        await arcee.sender.change_state(arcee.run, arcee.token, state, True)
+    finally:
+        arcee.shutdown_flag.set()
+        if arcee.hb is not None:
+            arcee.hb.cancel()
+            try:
+                await arcee.hb
+            except asyncio.CancelledError:
+                pass
+        if arcee.sampler is not None:
+            arcee.sampler.stop()
+        HardwareCollector.close()
+        try:
+            await arcee.sender.close()
+        except Exception:
+            pass
+
+
+async def finish():
+    await _shutdown(2)
+
+
+async def error():
+    await _shutdown(3)
+
+
+def info():
+    arcee = AsyncArcee()
+    return arcee.__dict__
+
+
+def send(data):
+    """
+    Queue metrics, they are sent in batches in the background.
+    Doesn't need to be awaited
+    Args:
+        data: dict of metric names and numeric values
+    Returns:
+    """
+    arcee = AsyncArcee()
+    arcee.metrics.put({
+        "project": arcee.task_key,
+        "run": arcee.run,
+        "data": data,
+        "timestamp": time.time(),
+    })
+
+
+async def model(key, path=None):
+    arcee = AsyncArcee()
+    arcee.model = await arcee.sender.add_model(arcee.token, key)
+    await arcee.sender.create_model_version(
+        arcee.run, arcee.model, arcee.token, path=path
+    )
+
+
+async def model_version(version):
+    arcee = AsyncArcee()
+    await arcee.sender.add_version(
+        arcee.run, arcee.model, arcee.token, version
+    )
+
+
+async def model_version_alias(alias):
+    arcee = AsyncArcee()
+    arcee.model_version_aliases = alias
+    await arcee.sender.add_version_aliases(
+        arcee.run, arcee.model, arcee.token,
+        list(arcee.model_version_aliases)
+    )
+
+
+async def model_version_tag(key, value):
+    arcee = AsyncArcee()
+    arcee.model_version_tags = (key, value)
+    await arcee.sender.add_version_tags(
+        arcee.run, arcee.model, arcee.token,
+        dict(arcee.model_version_tags)
+    )
+
+
+async def artifact(path, name=None, description=None, tags=None):
+    arcee = AsyncArcee()
+    arcee.artifacts = await arcee.sender.add_artifact(
+        arcee.token, arcee.run, arcee.name, arcee.task_key, path, name,
+        description, tags
+    )
+
+
+async def artifact_tag(path, key, value):
+    arcee = AsyncArcee()
+    arcee.artifacts = await arcee.sender.add_artifact_tags(
+        arcee.token, arcee.artifacts, path, key, value
+    )
@@ -1,14 +1,21 @@
-import asyncio
 import atexit
+import logging
 import time
 import threading
 import warnings
 
+from optscale_arcee.sender.batcher import MetricsBatcher
+from optscale_arcee.sender.retry import CircuitOpenError
 from optscale_arcee.sender.sender import Sender
+from optscale_arcee.sender.spool import Spool
 from optscale_arcee.collectors.console import (
     acquire_console, release_console)
+from optscale_arcee.collectors.hardware import Collector as HardwareCollector
+from optscale_arcee.collectors.sampler import Sampler
 from optscale_arcee.name_generator import NameGenerator
-from optscale_arcee.utils import single
+from optscale_arcee.utils import single, LoopThread, RunQueue
+
+LOG = logging.getLogger(__name__)
 
 
 class Job(threading.Thread):
@@ -18,33 +25,53 @@ class Job(threading.Thread):
         self.__shutdown_flag = shutdown_flag
         self.__kw = kwargs
 
-    def s_noblock(self, sender, run, token):
-        return asyncio.run(sender.send_proc_data(run, token))
+    def s_noblock(self, sender, run, token, sampler=None):
+        loop_thread = self.__kw.get("loop_thread")
+        return loop_thread.submit(
+            sender.send_proc_data(run, token, sampler))
 
     def job(self):
         args = self.__kw.get("meth_args", list())
-        self.s_noblock(*args)
+        try:
+            self.s_noblock(*args).result()
+        except CircuitOpenError as exc:
+            LOG.debug("Heartbeat is skipped: %s", exc)
+        except Exception as exc:
+            # heartbeat keeps running until the run is finished
+            LOG.warning("Failed to send heartbeat: %r", exc)
 
     def run(self):
         sleep = self.__kw.get("sleep")
         if not sleep or not isinstance(sleep, int):
             # 1 second by default
             sleep = 1
+        next_run = time.monotonic()
         while not self.__shutdown_flag.is_set():
             self.job()
-            time.sleep(sleep)
+            # ticks follow the period regardless of the job duration, late
+            # ticks are not caught up
+            next_run = max(next_run + sleep, time.monotonic())
+            self.__shutdown_flag.wait(next_run - time.monotonic())
 
 
-@single
-class Arcee:
+class ArceeState:
+    """
+    Run state shared by the sync and the asyncio APIs
+    """
+
     def __init__(
-        self, token=None, task_key=None, endpoint_url=None, ssl=True
+        self, token=None, task_key=None, endpoint_url=None, ssl=True,
+        spool_dir=None, compression=None
     ):
         self.shutdown_flag = threading.Event()
         self.token = token
         self.task_key = task_key
-        self.sender = Sender(endpoint_url, ssl, self.shutdown_flag)
+        spool = Spool.create(spool_dir) if spool_dir else None
+        self.sender = Sender(endpoint_url, ssl, self.shutdown_flag,
+                             spool=spool, compression=compression)
         self.hb = None
+        self.sampler = None
+        self.metrics = None
         self._run = None
         self._tags = dict()
         self._name = None
@@ -98,16 +125,6 @@ class Arcee:
     def dataset(self, value):
         self._dataset = value
 
-    def __enter__(self):
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        if exc_type is None:
-            finish()
-        else:
-            error()
-        return exc_type is None
-
     @property
     def model(self):
         return self._model
@@ -156,6 +173,59 @@ class Arcee:
         }
 
 
+@single
+class Arcee(ArceeState):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # all coroutines are run by this thread
+        self.loop_thread = LoopThread()
+        self.loop_thread.start()
+        # operations wait for the run created in the background
+        self.queue = RunQueue(self.loop_thread)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            finish()
+        else:
+            error()
+        return exc_type is None
+
+
+def _run(coro):
+    return Arcee().loop_thread.submit(coro).result()
+
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        LOG.warning("Failed to send run data: %r", future.exception())
+
+
+def _call(coro_fn, *args):
+    """
+    Runs coro_fn(*args) once the run is created. Calls made while the run
+    is being created are queued and return immediately, later calls wait
+    for the result
+    """
+    queue = Arcee().queue
+    pending = queue.pending
+    future = queue.submit(coro_fn, *args)
+    if pending:
+        future.add_done_callback(_log_failure)
+        return None
+    return future.result()
+
+
+def _close_sender():
+    arcee = Arcee()
+    try:
+        _run(arcee.sender.close())
+    except Exception:
+        pass
+
+
 def _unhandled_finish():
     arcee = Arcee()
     if not arcee.shutdown_flag.is_set():
@@ -168,30 +238,57 @@ def _unhandled_finish():
         finish()
 
 
+async def _create_run(period):
+    arcee = Arcee()
+    try:
+        run_id = (await arcee.sender.get_run_id(
+            arcee.task_key, arcee.token, arcee.name))["id"]
+    except Exception:
+        # metrics are never flushed without the run
+        arcee.metrics.close()
+        raise
+    arcee.run = run_id
+    arcee.sampler.start()
+    arcee.hb = Job(
+        meth_args=(arcee.sender, run_id, arcee.token, arcee.sampler),
+        loop_thread=arcee.loop_thread,
+        sleep=period,
+        shutdown_flag=arcee.shutdown_flag,
+    )
+    arcee.hb.start()
+    await arcee.metrics.start()
+    return run_id
+
+
+async def _send_stats_batch(points):
+    arcee = Arcee()
+    for point in points:
+        point["run"] = arcee.run
+    await arcee.sender.send_stats_batch(arcee.token, points)
+
+
 def init(
-    token, task_key, run_name=None, endpoint_url=None, ssl=True, period=1
+    token, task_key, run_name=None, endpoint_url=None, ssl=True, period=1,
+    spool_dir=None, compression=None, sample_period=None
 ):
+    """
+    Starts a run. The run is created in the background, calls made before
+    it's created are queued
+    """
     acquire_console()
-    arcee = Arcee(token, task_key, endpoint_url, ssl)
+    arcee = Arcee(token, task_key, endpoint_url, ssl, spool_dir, compression)
     name = (
         run_name if run_name is not None else NameGenerator.get_random_name()
     )
     arcee.name = name
-    run_id = asyncio.run(arcee.sender.get_run_id(task_key, token, name))["id"]
-    arcee.run = run_id
-    arcee.hb = Job(
-        meth_args=(arcee.sender, run_id, token),
-        sleep=period,
-        shutdown_flag=arcee.shutdown_flag,
-    )
-    arcee.hb.start()
+    arcee.metrics = MetricsBatcher(_send_stats_batch)
+    arcee.sampler = Sampler(sample_period)
+    arcee.queue.start(_create_run(period))
     atexit.register(_unhandled_finish)
-    asyncio.run(
-        arcee.sender.send_stats(
-            arcee.token,
-            {"project": arcee.task_key, "run": arcee.run, "data": {}},
-        )
-    )
+    _call(lambda: arcee.sender.send_stats(
+        arcee.token,
+        {"project": arcee.task_key, "run": arcee.run, "data": {}},
+    ))
     return arcee
 
 
@@ -205,83 +302,71 @@ def hyperparam(key, value):
     """
     arcee = Arcee()
     arcee.hyperparams = (key, value)
-    asyncio.run(arcee.sender.add_hyperparams(
-        arcee.run, arcee.token, arcee.hyperparams))
+    hyperparams = dict(arcee.hyperparams)
+    _call(lambda: arcee.sender.add_hyperparams(
+        arcee.run, arcee.token, hyperparams))
 
 
 def tag(key, value):
     arcee = Arcee()
     arcee.tags = (key, value)
-    asyncio.run(arcee.sender.add_tags(arcee.run, arcee.token, arcee.tags))
+    tags = dict(arcee.tags)
+    _call(lambda: arcee.sender.add_tags(arcee.run, arcee.token, tags))
 
 
 def milestone(value):
     arcee = Arcee()
-    asyncio.run(arcee.sender.add_milestone(arcee.run, arcee.token, value))
+    _call(lambda: arcee.sender.add_milestone(arcee.run, arcee.token, value))
 
 
 def stage(name):
     arcee = Arcee()
-    asyncio.run(arcee.sender.create_stage(arcee.run, arcee.token, name))
+    _call(lambda: arcee.sender.create_stage(arcee.run, arcee.token, name))
 
 
 def dataset(path, name=None, description=None, labels=None):
     arcee = Arcee()
     if arcee.dataset is None:
         arcee.dataset = path
-        asyncio.run(arcee.sender.register_dataset(
+        _call(lambda: arcee.sender.register_dataset(
             arcee.token, arcee.run, arcee.name, arcee.task_key, path, name,
             description, labels
         ))
 
 
-def _send_console():
+async def _finish_run(state):
     arcee = Arcee()
+    await arcee.metrics.stop()
     try:
-        asyncio.run(
-            arcee.sender.send_console(
-                arcee.run,
-                arcee.token
-            )
-        )
+        await arcee.sender.send_console(arcee.run, arcee.token)
     except Exception:
         pass
+    await arcee.sender.change_state(arcee.run, arcee.token, state, True)
 
 
-def finish():
+def _finish(state):
     release_console()
     arcee = Arcee()
-    _send_console()
     try:
-        asyncio.run(
-            arcee.sender.change_state(
-                arcee.run,
-                arcee.token,
-                2,
-                True,
-            )
-        )
+        # queued calls are sent first
+        arcee.queue.submit(_finish_run, state).result()
     finally:
         arcee.shutdown_flag.set()
-        arcee.hb.join()
+        if arcee.hb is not None:
+            arcee.hb.join()
+        arcee.sampler.stop()
+        # points left if the run wasn't created
+        arcee.metrics.close()
+        HardwareCollector.close()
+        _close_sender()
+
+
+def finish():
+    _finish(2)
 
 
 def error():
-    release_console()
-    arcee = Arcee()
-    _send_console()
-    try:
-        asyncio.run(
-            arcee.sender.change_state(
-                arcee.run,
-                arcee.token,
-                3,
-                True,
-            )
-        )
-    finally:
-        arcee.shutdown_flag.set()
-        arcee.hb.join()
+    _finish(3)
 
 
 def info():
@@ -290,72 +375,75 @@ def info():
 
 
 def send(data):
+    """
+    Queue metrics, they are sent in batches in the background
+    Args:
+        data: dict of metric names and numeric values
+    Returns:
+    """
     arcee = Arcee()
-    asyncio.run(
-        arcee.sender.send_stats(
-            arcee.token,
-            {"project": arcee.task_key, "run": arcee.run, "data": data},
-        )
-    )
+    arcee.metrics.put({
+        "project": arcee.task_key,
+        "data": data,
+        "timestamp": time.time(),
+    })
 
 
 def model(key, path=None):
     arcee = Arcee()
-    arcee.model = asyncio.run(
-        arcee.sender.add_model(
-            arcee.token, key
-        )
-    )
-    asyncio.run(
-        arcee.sender.create_model_version(
+
+    async def add_model():
+        arcee.model = await arcee.sender.add_model(arcee.token, key)
+        await arcee.sender.create_model_version(
             arcee.run, arcee.model, arcee.token, path=path
         )
-    )
+
+    _call(add_model)
 
 
 def model_version(version):
     arcee = Arcee()
-    asyncio.run(
-        arcee.sender.add_version(
-            arcee.run, arcee.model, arcee.token, version
-        )
-    )
+    _call(lambda: arcee.sender.add_version(
+        arcee.run, arcee.model, arcee.token, version
+    ))
 
 
 def model_version_alias(alias):
     arcee = Arcee()
     arcee.model_version_aliases = alias
-    asyncio.run(
-        arcee.sender.add_version_aliases(
-            arcee.run, arcee.model, arcee.token, arcee.model_version_aliases
-        )
-    )
+    aliases = list(arcee.model_version_aliases)
+    _call(lambda: arcee.sender.add_version_aliases(
+        arcee.run, arcee.model, arcee.token, aliases
+    ))
 
 
 def model_version_tag(key, value):
     arcee = Arcee()
     arcee.model_version_tags = (key, value)
-    asyncio.run(
-        arcee.sender.add_version_tags(
-            arcee.run, arcee.model, arcee.token, arcee.model_version_tags
-        )
-    )
+    tags = dict(arcee.model_version_tags)
+    _call(lambda: arcee.sender.add_version_tags(
+        arcee.run, arcee.model, arcee.token, tags
+    ))
 
 
 def artifact(path, name=None, description=None, tags=None):
     arcee = Arcee()
-    arcee.artifacts = asyncio.run(
-        arcee.sender.add_artifact(
+
+    async def add_artifact():
+        arcee.artifacts = await arcee.sender.add_artifact(
             arcee.token, arcee.run, arcee.name, arcee.task_key, path, name,
             description, tags
         )
-    )
+
+    _call(add_artifact)
 
 
 def artifact_tag(path, key, value):
     arcee = Arcee()
-    arcee.artifacts = asyncio.run(
-        arcee.sender.add_artifact_tags(
+
+    async def add_artifact_tags():
+        arcee.artifacts = await arcee.sender.add_artifact_tags(
             arcee.token, arcee.artifacts, path, key, value
         )
-    )
+
+    _call(add_artifact_tags)
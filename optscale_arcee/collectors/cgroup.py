@@ -0,0 +1,267 @@
+import os
+import sys
+import threading
+import time
+
+# v1 reports no memory limit as the largest page aligned long
+_UNLIMITED = 1 << 60
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except (OSError, ValueError):
+        return None
+
+
+def _read_int(path):
+    value = _read(path)
+    if value is None:
+        return None
+    try:
+        return int(value.strip())
+    except ValueError:
+        return None
+
+
+def _read_keys(path):
+    """
+    Values of "key value" lines, cpu.stat and memory.stat files
+    """
+    result = dict()
+    for line in (_read(path) or "").splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1].isdigit():
+            result[parts[0]] = int(parts[1])
+    return result
+
+
+class Cgroup:
+    """
+    Reads cpu and memory limits, usage and throttling of the cgroup the
+    process belongs to, cgroup v2 and v1 hierarchies are supported. Limits
+    of parent cgroups apply as well, so the lowest one is effective
+    """
+
+    def __init__(self, root="/sys/fs/cgroup", proc_root="/proc"):
+        """
+        :param root: cgroupfs mount point
+        :param proc_root: procfs mount point, /proc/self/cgroup has paths
+        of the process cgroups
+        """
+        self.root = root
+        self._lock = threading.Lock()
+        self._prev = None
+        paths = self._cgroup_paths(os.path.join(proc_root, "self", "cgroup"))
+        if os.path.exists(os.path.join(root, "cgroup.controllers")):
+            self.version = 2
+            self._cpu_dir = self._memory_dir = self._cgroup_dir(
+                root, paths.get(""))
+        else:
+            self.version = 1
+            self._cpu_dir = self._v1_dir(paths, "cpu")
+            self._cpuacct_dir = self._v1_dir(paths, "cpuacct")
+            self._memory_dir = self._v1_dir(paths, "memory")
+
+    @staticmethod
+    def _cgroup_paths(path):
+        """
+        :return: (dict) cgroup path by controller, "" for v2
+        """
+        paths = dict()
+        for line in (_read(path) or "").splitlines():
+            parts = line.split(":", 2)
+            if len(parts) != 3:
+                continue
+            for controller in parts[1].split(","):
+                paths[controller] = parts[2]
+        return paths
+
+    @staticmethod
+    def _cgroup_dir(mount, path):
+        if path is not None:
+            directory = os.path.normpath(
+                os.path.join(mount, path.lstrip("/")))
+            if os.path.isdir(directory):
+                return directory
+        # a container sees its own cgroup as the mount root
+        return mount
+
+    def _v1_dir(self, paths, controller):
+        for name in (controller, "cpu,cpuacct", "cpuacct,cpu"):
+            mount = os.path.join(self.root, name)
+            if os.path.isdir(mount):
+                return self._cgroup_dir(mount, paths.get(controller))
+        return None
+
+    def _ancestors(self, directory, mount):
+        while True:
+            yield directory
+            if directory == mount or len(directory) <= len(mount):
+                return
+            directory = os.path.dirname(directory)
+
+    def _mount(self, directory):
+        if self.version == 2:
+            return self.root
+        return os.path.join(
+            self.root, os.path.relpath(directory, self.root).split(os.sep)[0])
+
+    def _lowest(self, directory, read):
+        if directory is None:
+            return None
+        values = [read(d) for d in self._ancestors(
+            directory, self._mount(directory))]
+        values = [v for v in values if v is not None]
+        return min(values) if values else None
+
+    @staticmethod
+    def _cpu_limit_v2(directory):
+        value = _read(os.path.join(directory, "cpu.max"))
+        if value is None:
+            return None
+        quota, _, period = value.strip().partition(" ")
+        if quota == "max" or not period:
+            return None
+        return int(quota) / int(period)
+
+    @staticmethod
+    def _cpu_limit_v1(directory):
+        quota = _read_int(os.path.join(directory, "cpu.cfs_quota_us"))
+        period = _read_int(os.path.join(directory, "cpu.cfs_period_us"))
+        if not quota or quota < 0 or not period:
+            return None
+        return quota / period
+
+    @staticmethod
+    def _memory_limit(directory, name):
+        value = _read(os.path.join(directory, name))
+        if value is None or value.strip() == "max":
+            return None
+        value = int(value)
+        return value if value < _UNLIMITED else None
+
+    def cpu_limit(self):
+        """
+        :return: (float) number of cpus the cgroup may use or None
+        """
+        if self.version == 2:
+            return self._lowest(self._cpu_dir, self._cpu_limit_v2)
+        return self._lowest(self._cpu_dir, self._cpu_limit_v1)
+
+    def memory_limit(self):
+        """
+        :return: (int) memory limit in bytes or None
+        """
+        name = "memory.max" if self.version == 2 else "memory.limit_in_bytes"
+        return self._lowest(
+            self._memory_dir, lambda d: self._memory_limit(d, name))
+
+    def memory_used(self):
+        """
+        :return: (int) memory used by the cgroup in bytes without inactive
+        page cache, the working set the container runtimes report
+        """
+        if self._memory_dir is None:
+            return None
+        if self.version == 2:
+            usage = _read_int(os.path.join(self._memory_dir, "memory.current"))
+            inactive = "inactive_file"
+        else:
+            usage = _read_int(
+                os.path.join(self._memory_dir, "memory.usage_in_bytes"))
+            inactive = "total_inactive_file"
+        if usage is None:
+            return None
+        stat = _read_keys(os.path.join(self._memory_dir, "memory.stat"))
+        return max(0, usage - stat.get(inactive, 0))
+
+    def cpu_stat(self):
+        """
+        :return: (dict) cpu time used and time throttled in seconds,
+        number of enforcement periods and throttled periods
+        """
+        if self.version == 2:
+            stat = _read_keys(os.path.join(self._cpu_dir, "cpu.stat"))
+            usage = stat.get("usage_usec")
+            throttled = stat.get("throttled_usec")
+            result = {
+                "usage": usage / 1e6 if usage is not None else None,
+                "throttled": throttled / 1e6 if throttled is not None
+                else None,
+            }
+        else:
+            stat = _read_keys(os.path.join(self._cpu_dir, "cpu.stat")) if (
+                self._cpu_dir) else dict()
+            usage = _read_int(os.path.join(
+                self._cpuacct_dir, "cpuacct.usage")) if (
+                self._cpuacct_dir) else None
+            throttled = stat.get("throttled_time")
+            result = {
+                "usage": usage / 1e9 if usage is not None else None,
+                "throttled": throttled / 1e9 if throttled is not None
+                else None,
+            }
+        result["periods"] = stat.get("nr_periods")
+        result["throttled_periods"] = stat.get("nr_throttled")
+        return result
+
+    def sample(self):
+        """
+        :return: (dict) limits and usage of the cgroup, rates are computed
+        since the previous sample and are missing in the first one
+        """
+        cpu_limit = self.cpu_limit()
+        memory_limit = self.memory_limit()
+        memory_used = self.memory_used()
+        stat = self.cpu_stat()
+        now = time.monotonic()
+        stats = {
+            "version": self.version,
+            "cpu_limit": cpu_limit,
+            "memory_limit": memory_limit,
+            "memory_used": memory_used,
+        }
+        if memory_limit and memory_used is not None:
+            stats["memory_percent"] = round(
+                memory_used / memory_limit * 100, 1)
+        with self._lock:
+            prev, self._prev = self._prev, (now, stat)
+        if prev is None:
+            return stats
+        elapsed = now - prev[0]
+        prev_stat = prev[1]
+
+        def delta(key):
+            if stat[key] is None or prev_stat[key] is None:
+                return None
+            return max(0, stat[key] - prev_stat[key])
+
+        usage, throttled = delta("usage"), delta("throttled")
+        periods = delta("periods")
+        throttled_periods = delta("throttled_periods")
+        if usage is not None and elapsed > 0:
+            cpus = cpu_limit or os.cpu_count() or 1
+            stats["cpu_percent"] = round(
+                min(100.0, usage / elapsed / cpus * 100), 2)
+        if throttled is not None:
+            stats["throttled_seconds"] = round(float(throttled), 3)
+        if periods:
+            stats["throttled_percent"] = round(
+                throttled_periods / periods * 100, 1)
+        return stats
+
+
+def create_cgroup(root="/sys/fs/cgroup"):
+    """
+    Returns cgroup of the process on Linux if cgroupfs is mounted,
+    otherwise None
+    """
+    if not sys.platform.startswith("linux") or not os.path.isdir(root):
+        return None
+    cgroup = Cgroup(root)
+    if cgroup.version == 1 and cgroup._memory_dir is None and (
+            cgroup._cpu_dir is None):
+        return None
+    return cgroup
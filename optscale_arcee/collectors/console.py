@@ -1,6 +1,10 @@
+import codecs
 import concurrent.futures
-from io import StringIO
+import json
+import mmap
 import sys
+import tempfile
+import threading
 from typing import Dict
 
 from optscale_arcee.utils import run_async
@@ -26,9 +30,135 @@ class StdProxy:
         return inner
 
 
+class CaptureBuffer:
+    """
+    Keeps written text encoded to utf-8, in memory up to memory_limit bytes
+    and in a temporary file after that. Once more than max_size bytes are
+    written, only the first head_size bytes and the last
+    max_size - head_size bytes are kept. Limits are set before writing
+    """
+    memory_limit = 1024 * 1024
+    max_size = 16 * 1024 * 1024
+    head_size = 4 * 1024 * 1024
+    chunk_size = 256 * 1024
+    # directory of the temporary file, the system one by default
+    spill_dir = None
+
+    def __init__(self, memory_limit=None, max_size=None, head_size=None,
+                 spill_dir=None):
+        if memory_limit is not None:
+            self.memory_limit = memory_limit
+        if max_size is not None:
+            self.max_size = max_size
+        if head_size is not None:
+            self.head_size = head_size
+        if spill_dir is not None:
+            self.spill_dir = spill_dir
+        self._lock = threading.Lock()
+        self._memory = bytearray()
+        self._file = None
+        # number of bytes written
+        self.size = 0
+
+    @property
+    def spilled(self):
+        return self._file is not None
+
+    def _position(self, offset):
+        """
+        Position of the written byte offset, the tail is kept as a ring
+        after the head
+        """
+        if offset < self.head_size:
+            return offset
+        tail_size = self.max_size - self.head_size
+        return self.head_size + (offset - self.head_size) % tail_size
+
+    def _spill(self):
+        self._file = tempfile.TemporaryFile(
+            prefix="arcee-console-", dir=self.spill_dir)
+        self._file.write(self._memory)
+        self._memory = bytearray()
+
+    def _store(self, position, data):
+        if self._file is None and position + len(data) > self.memory_limit:
+            self._spill()
+        if self._file is None:
+            self._memory[position:position + len(data)] = data
+        else:
+            self._file.seek(position)
+            self._file.write(data)
+
+    def write(self, text):
+        data = text if isinstance(text, bytes) else text.encode(
+            "utf-8", "backslashreplace")
+        view = memoryview(data)
+        tail_size = self.max_size - self.head_size
+        with self._lock:
+            offset = self.size
+            while view:
+                if offset < self.head_size:
+                    size = min(len(view), self.head_size - offset)
+                else:
+                    if len(view) > tail_size:
+                        # would be overwritten in the tail anyway
+                        offset += len(view) - tail_size
+                        view = view[len(view) - tail_size:]
+                    size = min(len(view), (
+                        self.max_size - self._position(offset)))
+                self._store(self._position(offset), view[:size])
+                offset += size
+                view = view[size:]
+            self.size = offset
+
+    def _ranges(self, size):
+        if size <= self.max_size:
+            return [(0, size)]
+        start = self._position(size)
+        return [(0, self.head_size), None, (start, self.max_size),
+                (self.head_size, start)]
+
+    def chunks(self):
+        """
+        Iterates over the kept bytes, the file is read through mmap. A
+        marker line replaces bytes which are not kept
+        """
+        with self._lock:
+            size = self.size
+            if self._file is None:
+                source = bytes(self._memory)
+            else:
+                self._file.flush()
+                source = mmap.mmap(
+                    self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for part in self._ranges(size):
+                if part is None:
+                    yield ("\n... %s bytes skipped ...\n" % (
+                        size - self.max_size)).encode("utf-8")
+                    continue
+                start, end = part
+                for offset in range(start, end, self.chunk_size):
+                    yield source[offset:min(end, offset + self.chunk_size)]
+        finally:
+            if isinstance(source, mmap.mmap):
+                source.close()
+
+    def getvalue(self):
+        return b"".join(self.chunks()).decode("utf-8", "replace")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._memory = bytearray()
+            self.size = 0
+
+
 class WritesCollector:
     def __init__(self, std_stream):
-        self.stream = StringIO()
+        self.stream = CaptureBuffer()
         self.cb_map = {
             'write': self.handle_write()
         }
@@ -45,6 +175,22 @@ class WritesCollector:
     def get_writes(self):
         return self.stream.getvalue()
 
+    def json_chunks(self):
+        """
+        Iterates over the writes encoded as a json string
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        yield b'"'
+        for chunk in self.stream.chunks():
+            text = decoder.decode(chunk)
+            if text:
+                yield json.dumps(text, ensure_ascii=False)[1:-1].encode(
+                    "utf-8")
+        text = decoder.decode(b"", True)
+        if text:
+            yield json.dumps(text, ensure_ascii=False)[1:-1].encode("utf-8")
+        yield b'"'
+
 
 stdout_writes = WritesCollector(sys.stdout)
 stderr_writes = WritesCollector(sys.stderr)
@@ -70,6 +216,18 @@ class Collector:
             "error": stderr_writes.get_writes()
         }
 
+    @staticmethod
+    def json_chunks():
+        """
+        Iterates over the json document of the collected output, the
+        output isn't loaded in memory as a whole
+        """
+        yield b'{"output":'
+        yield from stdout_writes.json_chunks()
+        yield b',"error":'
+        yield from stderr_writes.json_chunks()
+        yield b'}'
+
     @classmethod
     async def collect(cls):
         return await run_async(cls._collect, executor=cls.executor)
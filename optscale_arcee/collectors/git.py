@@ -1,56 +1,254 @@
 import concurrent.futures
+import logging
 import os
-import sys
+import struct
 import subprocess
+import sys
+import time
 
 from typing import Optional
 
 from optscale_arcee.utils import run_async
 
+LOG = logging.getLogger(__name__)
+
 EXECUTABLE_DIR = os.path.dirname(os.path.realpath(sys.argv[0]))
 
+# index entry fields up to the path: ctime, mtime, dev, ino, mode, uid,
+# gid, size, object id and flags
+_INDEX_ENTRY = struct.Struct(">IIIIIIIIII20sH")
+_GITLINK_MODE = 0o160000
+_EXTENDED_FLAG = 0x4000
+_SKIP_WORKTREE_FLAG = 0x4000
+_ASSUME_VALID_FLAG = 0x8000
 
-class Collector:
-    executor = concurrent.futures.ThreadPoolExecutor(max_workers=3)
 
-    @staticmethod
-    def __get_remote() -> str:
-        return subprocess.check_output(
-            ["git", "config", "--get", "remote.origin.url"],
-            cwd=EXECUTABLE_DIR
-        ).decode('UTF-8').strip()
+class Repository:
+    """
+    Git repository files: gitdir holds HEAD and the index of the working
+    tree, commondir holds refs and config shared by linked worktrees
+    """
 
-    @staticmethod
-    def __get_branch() -> str:
-        return subprocess.check_output(
-            ["git", "branch", "--show-current"],
-            cwd=EXECUTABLE_DIR).decode('UTF-8').strip()
+    def __init__(self, worktree, gitdir):
+        self.worktree = worktree
+        self.gitdir = gitdir
+        self.commondir = gitdir
+        commondir_path = os.path.join(gitdir, "commondir")
+        if os.path.isfile(commondir_path):
+            with open(commondir_path) as f:
+                self.commondir = os.path.normpath(
+                    os.path.join(gitdir, f.read().strip()))
 
-    @staticmethod
-    def __get_commit_id() -> str:
-        return subprocess.check_output(
-            ["git", "rev-parse", "HEAD"],
-            cwd=EXECUTABLE_DIR).decode('UTF-8').strip()
+    @classmethod
+    def find(cls, path):
+        """
+        Finds repository of path, .git may be a file pointing to gitdir of
+        a linked worktree or a submodule
+        :return: (Repository) repository or None
+        """
+        path = os.path.abspath(path)
+        while True:
+            dot_git = os.path.join(path, ".git")
+            if os.path.isdir(dot_git):
+                return cls(path, dot_git)
+            if os.path.isfile(dot_git):
+                with open(dot_git) as f:
+                    content = f.read().strip()
+                if content.startswith("gitdir:"):
+                    gitdir = content[len("gitdir:"):].strip()
+                    return cls(path, os.path.normpath(
+                        os.path.join(path, gitdir)))
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
 
     @staticmethod
-    def __get_status() -> str:
+    def _read(path) -> Optional[str]:
+        try:
+            with open(path) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _packed_refs(self) -> dict:
+        refs = dict()
+        content = self._read(os.path.join(self.commondir, "packed-refs"))
+        for line in (content or "").splitlines():
+            if not line or line[0] in "#^":
+                continue
+            commit_id, _, ref = line.partition(" ")
+            refs[ref.strip()] = commit_id
+        return refs
+
+    def head(self) -> Optional[str]:
+        return self._read(os.path.join(self.gitdir, "HEAD"))
+
+    def resolve(self, ref) -> Optional[str]:
+        """
+        Resolves symbolic or loose/packed ref to commit id
+        """
+        # symbolic refs chains are short
+        for _ in range(5):
+            if not ref.startswith("ref:"):
+                return ref
+            name = ref[len("ref:"):].strip()
+            # per-worktree refs are kept in gitdir
+            ref = self._read(os.path.join(self.gitdir, name)) or self._read(
+                os.path.join(self.commondir, name))
+            if ref is None:
+                return self._packed_refs().get(name)
+        return None
+
+    def config(self) -> dict:
+        """
+        Parses config sections to {"section subsection": {key: value}}
+        """
+        sections = dict()
+        current = None
+        content = self._read(os.path.join(self.commondir, "config"))
+        for line in (content or "").splitlines():
+            line = line.strip()
+            if not line or line[0] in "#;":
+                continue
+            if line.startswith("["):
+                name, _, subsection = line.strip("[]").partition(" ")
+                current = sections.setdefault(
+                    ("%s %s" % (name.lower(), subsection.strip('"'))).strip(),
+                    dict())
+            elif current is not None:
+                key, _, value = line.partition("=")
+                current[key.strip().lower()] = value.strip().strip('"')
+        return sections
+
+    def index_entries(self):
+        """
+        Parses index v2/v3 entries
+        :return: list of (path, mtime, mtime ns, size) or None if index
+        format isn't supported
+        """
+        try:
+            with open(os.path.join(self.gitdir, "index"), "rb") as f:
+                data = f.read()
+        except OSError:
+            return list()
+        if data[:4] != b"DIRC":
+            return None
+        version, count = struct.unpack(">II", data[4:12])
+        if version not in (2, 3):
+            return None
+        entries = list()
+        offset = 12
+        for _ in range(count):
+            (_, _, mtime, mtime_ns, _, _, mode, _, _, size, _,
+             flags) = _INDEX_ENTRY.unpack_from(data, offset)
+            path_offset = offset + _INDEX_ENTRY.size
+            ext_flags = 0
+            if flags & _EXTENDED_FLAG:
+                ext_flags, = struct.unpack_from(">H", data, path_offset)
+                path_offset += 2
+            path_end = data.index(b"\0", path_offset)
+            # entries are padded with 1-8 nul bytes to a multiple of 8
+            offset += (path_end - offset + 8) & ~7
+            if mode == _GITLINK_MODE or flags & _ASSUME_VALID_FLAG or (
+                    ext_flags & _SKIP_WORKTREE_FLAG):
+                continue
+            entries.append((data[path_offset:path_end].decode(
+                "utf-8", "surrogateescape"), mtime, mtime_ns, size))
+        return entries
+
+
+class Collector:
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=3)
+    # seconds the working tree status check may take
+    status_timeout = 5
+    # the most changed files compared by path, with more changed files the
+    # whole working tree is compared
+    max_status_paths = 100
+    # parsed index entries by index path, mtime and size
+    _index_cache = dict()
+
+    @classmethod
+    def _index_entries(cls, repo):
+        try:
+            st = os.stat(os.path.join(repo.gitdir, "index"))
+        except OSError:
+            return list()
+        key = (repo.gitdir, st.st_mtime_ns, st.st_size)
+        if key not in cls._index_cache:
+            cls._index_cache.clear()
+            cls._index_cache[key] = repo.index_entries()
+        return cls._index_cache[key]
+
+    @classmethod
+    def _git_diff(cls, repo, paths, timeout) -> str:
         try:
-            subprocess.check_call(["git", "diff", "--exit-code", "--quiet"],
-                                  cwd=EXECUTABLE_DIR)
+            subprocess.run(
+                ["git", "--literal-pathspecs", "diff", "--exit-code",
+                 "--quiet", "--"] + paths,
+                cwd=repo.worktree, timeout=timeout, check=True,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             return "clean"
         except subprocess.CalledProcessError:
             return "dirty"
+        except (subprocess.TimeoutExpired, FileNotFoundError):
+            return "unknown"
+
+    @classmethod
+    def _get_status(cls, repo) -> str:
+        """
+        Compares working tree files stats with the index like git does, only
+        files with changed stats are compared by content
+        """
+        deadline = time.monotonic() + cls.status_timeout
+        entries = cls._index_entries(repo)
+        if entries is None:
+            return cls._git_diff(repo, [], cls.status_timeout)
+        changed = list()
+        for i, (path, mtime, mtime_ns, size) in enumerate(entries):
+            if i % 1000 == 0 and time.monotonic() > deadline:
+                return "unknown"
+            try:
+                st = os.lstat(os.path.join(repo.worktree, path))
+            except OSError:
+                return "dirty"
+            # index keeps 32 bit sizes and second/nanosecond mtime parts
+            stat = (st.st_size & 0xFFFFFFFF, st.st_mtime_ns // 10 ** 9,
+                    st.st_mtime_ns % 10 ** 9)
+            if stat != (size, mtime, mtime_ns):
+                changed.append(path)
+                if len(changed) > cls.max_status_paths:
+                    # e.g. a copy without mtimes, files may be the same
+                    return cls._git_diff(
+                        repo, [], max(0, deadline - time.monotonic()))
+        if not changed:
+            return "clean"
+        return cls._git_diff(
+            repo, changed, max(0, deadline - time.monotonic()))
 
     @classmethod
-    def _collect(cls) -> Optional[dict]:
+    def _collect(cls, path=None) -> Optional[dict]:
         try:
+            repo = Repository.find(path or EXECUTABLE_DIR)
+            if repo is None:
+                return
+            head = repo.head()
+            commit_id = repo.resolve(head) if head else None
+            remote = repo.config().get("remote origin", {}).get("url")
+            # as before, when git commands for these failed
+            if not commit_id or not remote:
+                return
+            branch = ""
+            if head.startswith("ref: refs/heads/"):
+                branch = head[len("ref: refs/heads/"):]
             return {
-                "remote": cls.__get_remote(),
-                "branch": cls.__get_branch(),
-                "commit_id": cls.__get_commit_id(),
-                "status": cls.__get_status()
+                "remote": remote,
+                "branch": branch,
+                "commit_id": commit_id,
+                "status": cls._get_status(repo)
             }
-        except (FileNotFoundError, subprocess.CalledProcessError):
+        except (OSError, ValueError, struct.error) as exc:
+            LOG.debug("Failed to collect git info: %r", exc)
             return
 
     @classmethod
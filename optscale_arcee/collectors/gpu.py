@@ -0,0 +1,313 @@
+import ctypes
+import logging
+import math
+import os
+import platform
+import shutil
+import subprocess
+import threading
+
+from optscale_arcee.libs.GPUtil import GPUtil
+
+LOG = logging.getLogger(__name__)
+
+_NVML_SUCCESS = 0
+_NVML_TEMPERATURE_GPU = 0
+_NVML_UUID_BUFFER_SIZE = 80
+_MB = 1024 * 1024
+
+
+class NvmlError(Exception):
+    def __init__(self, function, code):
+        super().__init__("%s failed with code %s" % (function, code))
+        self.code = code
+
+
+class _Utilization(ctypes.Structure):
+    _fields_ = [("gpu", ctypes.c_uint), ("memory", ctypes.c_uint)]
+
+
+class _Memory(ctypes.Structure):
+    _fields_ = [("total", ctypes.c_ulonglong), ("free", ctypes.c_ulonglong),
+                ("used", ctypes.c_ulonglong)]
+
+
+class GpuDevice:
+    """
+    GPU state, load is a fraction, memory is in MB, power is in watts.
+    Values a device doesn't report are None
+    """
+
+    def __init__(self, index, uuid, load, memory_total, memory_used,
+                 memory_free, temperature=None, power=None):
+        self.index = index
+        self.uuid = uuid
+        self.load = load
+        self.memory_total = memory_total
+        self.memory_used = memory_used
+        self.memory_free = memory_free
+        self.temperature = temperature
+        self.power = power
+
+
+class NvmlBackend:
+    """
+    Reads GPU state through NVML loaded with ctypes. The library is
+    initialized and device handles are obtained once
+    """
+
+    def __init__(self, lib=None):
+        """
+        :param lib: loaded NVML library, the system one by default
+        """
+        self._lib = lib if lib is not None else self._load_library()
+        self._lock = threading.Lock()
+        self._handles = list()
+        self._uuids = list()
+        self._call("nvmlInit_v2")
+        try:
+            count = ctypes.c_uint()
+            self._call("nvmlDeviceGetCount_v2", ctypes.byref(count))
+            for i in range(count.value):
+                handle = ctypes.c_void_p()
+                self._call("nvmlDeviceGetHandleByIndex_v2", i,
+                           ctypes.byref(handle))
+                uuid = ctypes.create_string_buffer(_NVML_UUID_BUFFER_SIZE)
+                self._call("nvmlDeviceGetUUID", handle, uuid,
+                           _NVML_UUID_BUFFER_SIZE)
+                self._handles.append(handle)
+                self._uuids.append(uuid.value.decode("utf-8", "replace"))
+        except NvmlError:
+            self._lib.nvmlShutdown()
+            raise
+        self._closed = False
+
+    @staticmethod
+    def _load_library():
+        if platform.system() == "Windows":
+            for path in (
+                "nvml.dll",
+                os.path.join(os.environ.get("systemdrive", "C:"),
+                             "\\Program Files\\NVIDIA Corporation\\NVSMI",
+                             "nvml.dll"),
+            ):
+                try:
+                    return ctypes.CDLL(path)
+                except OSError:
+                    continue
+            raise OSError("nvml.dll is not found")
+        return ctypes.CDLL("libnvidia-ml.so.1")
+
+    def _call(self, function, *args):
+        code = getattr(self._lib, function)(*args)
+        if code != _NVML_SUCCESS:
+            raise NvmlError(function, code)
+
+    def _optional(self, function, handle, *args):
+        value = ctypes.c_uint()
+        try:
+            self._call(function, handle, *args, ctypes.byref(value))
+        except NvmlError:
+            # not supported by the device
+            return None
+        return value.value
+
+    def devices(self):
+        """
+        :return: list of GpuDevice
+        """
+        result = list()
+        with self._lock:
+            for index, handle in enumerate(self._handles):
+                utilization = _Utilization()
+                memory = _Memory()
+                try:
+                    self._call("nvmlDeviceGetUtilizationRates", handle,
+                               ctypes.byref(utilization))
+                    self._call("nvmlDeviceGetMemoryInfo", handle,
+                               ctypes.byref(memory))
+                except NvmlError as exc:
+                    LOG.debug("Failed to read GPU %s: %s", index, exc)
+                    continue
+                power = self._optional("nvmlDeviceGetPowerUsage", handle)
+                result.append(GpuDevice(
+                    index, self._uuids[index], utilization.gpu / 100,
+                    memory.total / _MB, memory.used / _MB, memory.free / _MB,
+                    temperature=self._optional(
+                        "nvmlDeviceGetTemperature", handle,
+                        _NVML_TEMPERATURE_GPU),
+                    power=power / 1000 if power is not None else None,
+                ))
+        return result
+
+    def close(self):
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._handles = list()
+                self._lib.nvmlShutdown()
+
+
+class NullBackend:
+    """
+    Backend of a host without NVIDIA GPUs
+    """
+
+    @staticmethod
+    def devices():
+        return []
+
+    def close(self):
+        pass
+
+
+class SmiBackend:
+    """
+    Reads GPU state by running nvidia-smi
+    """
+
+    @staticmethod
+    def devices():
+        return [
+            GpuDevice(gpu.id, gpu.uuid, gpu.load, gpu.memoryTotal,
+                      gpu.memoryUsed, gpu.memoryFree,
+                      temperature=gpu.temperature)
+            for gpu in GPUtil.getGPUs()
+        ]
+
+    def close(self):
+        pass
+
+
+def _smi_value(value):
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        # [N/A], [Not Supported]
+        return None
+
+
+class StreamingSmiBackend:
+    """
+    Keeps a single nvidia-smi process printing GPU state every interval_ms
+    milliseconds and keeps the latest state of every GPU. The process is
+    restarted with a growing delay if it exits
+    """
+    interval_ms = 500
+    restart_delay = 1
+    max_restart_delay = 60
+    query = ("index", "uuid", "utilization.gpu", "memory.total",
+             "memory.used", "memory.free", "temperature.gpu", "power.draw")
+
+    def __init__(self, nvidia_smi="nvidia-smi", interval_ms=None):
+        self.nvidia_smi = nvidia_smi
+        if interval_ms is not None:
+            self.interval_ms = interval_ms
+        self._gpus = dict()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._process = None
+        self.restarts = 0
+        self._thread = threading.Thread(
+            target=self._run, name="arcee-nvidia-smi", daemon=True)
+        self._thread.start()
+
+    def _command(self):
+        return [self.nvidia_smi, "--query-gpu=%s" % ",".join(self.query),
+                "--format=csv,noheader,nounits",
+                "-lms", str(self.interval_ms)]
+
+    def _parse(self, line):
+        values = line.split(",")
+        if len(values) != len(self.query):
+            return False
+        try:
+            index = int(values[0])
+        except ValueError:
+            return False
+        load, total, used, free, temperature, power = map(
+            _smi_value, values[2:])
+        gpu = GpuDevice(
+            index, values[1].strip(),
+            # unsupported load is nan, as parsed by GPUtil
+            load / 100 if load is not None else math.nan,
+            total, used, free, temperature=temperature, power=power)
+        with self._lock:
+            self._gpus[index] = gpu
+        return True
+
+    def _run(self):
+        delay = self.restart_delay
+        while not self._stopped.is_set():
+            try:
+                process = subprocess.Popen(
+                    self._command(), stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL, universal_newlines=True)
+            except OSError as exc:
+                LOG.debug("Failed to start nvidia-smi: %r", exc)
+                return
+            with self._lock:
+                self._process = process
+            if self._stopped.is_set():
+                process.terminate()
+            for line in process.stdout:
+                if self._parse(line):
+                    delay = self.restart_delay
+            process.stdout.close()
+            code = process.wait()
+            with self._lock:
+                self._process = None
+                # state of a crashed process is stale
+                self._gpus.clear()
+            if self._stopped.is_set():
+                return
+            LOG.debug("nvidia-smi exited with %s, restarting in %ss",
+                      code, delay)
+            self._stopped.wait(delay)
+            delay = min(delay * 2, self.max_restart_delay)
+            self.restarts += 1
+
+    def devices(self):
+        with self._lock:
+            return [self._gpus[i] for i in sorted(self._gpus)]
+
+    def close(self):
+        self._stopped.set()
+        with self._lock:
+            if self._process is not None:
+                self._process.terminate()
+        self._thread.join()
+
+
+def _windows_nvidia_smi():
+    """
+    Default nvidia-smi location on Windows or None if it doesn't exist
+    """
+    if platform.system() != "Windows":
+        return None
+    path = os.path.join(
+        os.environ.get("systemdrive", "C:"),
+        "\\Program Files\\NVIDIA Corporation\\NVSMI", "nvidia-smi.exe")
+    return path if os.path.exists(path) else None
+
+
+def create_backend(use_nvml=True):
+    """
+    Returns NVML backend if NVML is available and allowed, otherwise
+    streaming nvidia-smi one if nvidia-smi is installed. A host without
+    nvidia-smi gets a backend without devices, so nvidia-smi isn't
+    looked up on every sample
+    """
+    if use_nvml:
+        try:
+            return NvmlBackend()
+        except (OSError, AttributeError, NvmlError) as exc:
+            LOG.debug("NVML is not available, nvidia-smi is used: %r", exc)
+    nvidia_smi = shutil.which("nvidia-smi")
+    if nvidia_smi is not None:
+        return StreamingSmiBackend(nvidia_smi)
+    if _windows_nvidia_smi() is not None:
+        # GPUtil runs nvidia-smi from the default Windows location
+        return SmiBackend()
+    return NullBackend()
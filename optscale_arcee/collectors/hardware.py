@@ -1,84 +1,270 @@
 import math
 import os
 import concurrent.futures
-from functools import reduce
+import sys
+import threading
+import time
 
 import psutil
 
-from optscale_arcee.libs.GPUtil import GPUtil
+from optscale_arcee.collectors.cgroup import create_cgroup
+from optscale_arcee.collectors.gpu import create_backend
+from optscale_arcee.collectors.process_tree import ProcessTree
+from optscale_arcee.collectors.procfs import ProcfsReader
 from optscale_arcee.utils import run_async
 
 
-# tune accuracy depending on #cpus
-_MEASURE_TIME = 1 - 1 / (os.cpu_count())
-_TIME_INTERVALS = (_MEASURE_TIME + 0.05, _MEASURE_TIME + 0.01)
+def _cpu_busy_total(times):
+    """
+    Busy and total cpu time the way psutil.cpu_percent counts them
+    """
+    total = sum(times)
+    # guest time is already counted in user time on Linux
+    total -= getattr(times, "guest", 0) + getattr(times, "guest_nice", 0)
+    idle = times.idle + getattr(times, "iowait", 0)
+    return total - idle, total
+
+
+def _percent(busy, total, limit=100.0):
+    """
+    :param limit: maximum percent, None for a process using several cpus
+    """
+    if total <= 0:
+        return 0.0
+    percent = max(0.0, busy / total * 100)
+    if limit is not None:
+        percent = min(limit, percent)
+    return round(percent, 1)
+
+
+class PsutilReader:
+    """
+    Reads host and process stats with psutil, the process object is kept
+    between reads
+    """
+
+    def __init__(self):
+        self._process = None
+        self.cpu_count = psutil.cpu_count() or 1
+
+    def get_process(self):
+        # a forked child gets its own process
+        if self._process is None or self._process.pid != os.getpid():
+            self._process = psutil.Process(os.getpid())
+        return self._process
+
+    @staticmethod
+    def cpu_times():
+        return [_cpu_busy_total(t) for t in psutil.cpu_times(percpu=True)]
+
+    def process_cpu_time(self):
+        times = self.get_process().cpu_times()
+        return times.user + times.system
+
+    def process_age(self):
+        return time.time() - self.get_process().create_time()
+
+    def process_memory(self):
+        memory_info = self.get_process().memory_info()
+        return memory_info.vms, memory_info.rss
+
+    @staticmethod
+    def memory():
+        virtual_memory = psutil.virtual_memory()
+        return (virtual_memory.total, virtual_memory.used,
+                virtual_memory.percent, psutil.swap_memory().total)
+
+    @staticmethod
+    def loadavg():
+        return psutil.getloadavg()
+
+    def close(self):
+        pass
+
+
+def create_reader():
+    """
+    Returns procfs reader on Linux, psutil one on other systems
+    """
+    if sys.platform.startswith("linux") and ProcfsReader.available():
+        return ProcfsReader()
+    return PsutilReader()
+
+
+class CpuSampler:
+    """
+    Computes cpu usage from counters deltas between samples instead of
+    sleeping for a measurement interval. The first sample is the average
+    since boot for cpus and since start for the process
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self._lock = threading.Lock()
+        self._pid = None
+        self._cpu_times = None
+        self._proc_times = None
+
+    def sample(self):
+        """
+        :return: (list, float) usage percent of every cpu, process usage
+        percent of a single cpu, over 100 if several cpus are used
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._proc_times = None
+            cpu_times = self.reader.cpu_times()
+            proc_times = (self.reader.process_cpu_time(), time.monotonic())
+            prev_cpu_times = self._cpu_times
+            if prev_cpu_times is None or (
+                    len(prev_cpu_times) != len(cpu_times)):
+                prev_cpu_times = [(0, 0)] * len(cpu_times)
+            if self._proc_times is not None:
+                prev_proc_times = self._proc_times
+            else:
+                started_ago = self.reader.process_age()
+                prev_proc_times = (0, proc_times[1] - started_ago)
+            self._cpu_times, self._proc_times = cpu_times, proc_times
+        cpu_load = [
+            _percent(busy - prev_busy, total - prev_total)
+            for (busy, total), (prev_busy, prev_total) in zip(
+                cpu_times, prev_cpu_times)
+        ]
+        # a process running on several cpus uses more than 100%
+        proc_percent = _percent(proc_times[0] - prev_proc_times[0],
+                                proc_times[1] - prev_proc_times[1], None)
+        return cpu_load, proc_percent
 
 
 class Collector:
     executor = concurrent.futures.ThreadPoolExecutor(max_workers=10)
+    reader = create_reader()
+    cpu_sampler = CpuSampler(reader)
+    # limits of the container the process runs in
+    cgroup = create_cgroup()
+    # GPU state is read with nvidia-smi only if disabled
+    use_nvml = True
+    _gpu_backend = None
+    _gpu_lock = threading.Lock()
+    _process_tree = None
+
+    @classmethod
+    def gpu_backend(cls):
+        """
+        GPU backend is created on the first use and kept open
+        """
+        with cls._gpu_lock:
+            if cls._gpu_backend is None:
+                cls._gpu_backend = create_backend(cls.use_nvml)
+            return cls._gpu_backend
+
+    @classmethod
+    def process_tree(cls):
+        # a forked child tracks its own tree
+        if cls._process_tree is None or cls._process_tree.pid != os.getpid():
+            cls._process_tree = ProcessTree(reader=cls.cpu_sampler.reader)
+        return cls._process_tree
+
+    @classmethod
+    def close(cls):
+        with cls._gpu_lock:
+            if cls._gpu_backend is not None:
+                cls._gpu_backend.close()
+                cls._gpu_backend = None
 
     @staticmethod
-    def _gpu_stats():
-        gpus = GPUtil.getGPUs()
-        len_gpus = len(gpus)
-        if len_gpus < 1:
-            return {}
-        avg_gpu_load = reduce(
-            lambda x, y: x + y, map(lambda z: z.load, gpus)
-        ) / len(gpus)
-        avg_gpu_memory_free = reduce(
-            lambda x, y: x + y, map(lambda z: z.memoryFree, gpus)
-        ) / len(gpus)
-        avg_gpu_memory_total = reduce(
-            lambda x, y: x + y, map(lambda z: z.memoryTotal, gpus)
-        ) / len(gpus)
-        avg_gpu_memory_used = reduce(
-            lambda x, y: x + y, map(lambda z: z.memoryUsed, gpus)
-        ) / len(gpus)
-        stats = {
-            "avg_gpu_memory_free": avg_gpu_memory_free,
-            "avg_gpu_memory_total": avg_gpu_memory_total,
-            "avg_gpu_memory_used": avg_gpu_memory_used,
+    def _gpu_columns(gpus):
+        """
+        Per-device values, one list per field indexed by device
+        """
+        def column(values, digits):
+            return [None if v is None or math.isnan(v) else round(v, digits)
+                    for v in values]
+
+        return {
+            "index": [g.index for g in gpus],
+            "uuid": [g.uuid for g in gpus],
+            # percent
+            "load": column((g.load * 100 for g in gpus), 1),
+            # MB
+            "memory_used": column((g.memory_used for g in gpus), 0),
+            "memory_total": column((g.memory_total for g in gpus), 0),
+            "memory_free": column((g.memory_free for g in gpus), 0),
+            # celsius
+            "temperature": column((g.temperature for g in gpus), 0),
+            # watts
+            "power": column((g.power for g in gpus), 1),
         }
-        # get rid of devices with limited support
-        if not math.isnan(avg_gpu_load):
-            stats["avg_gpu_load"] = avg_gpu_load * 100
-        return stats
 
     @staticmethod
-    def _ps_stats(cpu_interval=0.5, proc_interval=0.5):
-        load1, load5, load15 = psutil.getloadavg()
-        cpu_load = psutil.cpu_percent(interval=cpu_interval, percpu=True)
-        cpu_percent = round(sum(cpu_load) / psutil.cpu_count(), 2)
-        # get proc pid
-        process = psutil.Process(os.getpid())
+    def _gpu_averages(columns):
+        """
+        Averages of per-device values, devices which don't report a value
+        are skipped
+        """
+        averages = dict()
+        for field, name in (("memory_free", "avg_gpu_memory_free"),
+                            ("memory_total", "avg_gpu_memory_total"),
+                            ("memory_used", "avg_gpu_memory_used"),
+                            ("load", "avg_gpu_load"),
+                            ("temperature", "avg_gpu_temperature"),
+                            ("power", "avg_gpu_power")):
+            values = [v for v in columns[field] if v is not None]
+            if values:
+                averages[name] = sum(values) / len(values)
+        return averages
+
+    @classmethod
+    def _gpu_stats(cls):
+        gpus = cls.gpu_backend().devices()
+        if not gpus:
+            return {}
+        columns = cls._gpu_columns(gpus)
+        stats = cls._gpu_averages(columns)
+        stats["gpus"] = columns
+        return stats
+
+    @classmethod
+    def _ps_stats(cls):
+        reader = cls.cpu_sampler.reader
+        load1, load5, load15 = reader.loadavg()
+        cpu_count = reader.cpu_count
+        cpu_load, proc_cpu_load = cls.cpu_sampler.sample()
+        cpu_percent = round(sum(cpu_load) / cpu_count, 2)
         # physical mem according to https://psutil.readthedocs.io/en/latest/
-        physical_mem = psutil.virtual_memory().total
-        swap_mem = psutil.swap_memory().total
-        # virtual memory used by process
-        proc_vmem = process.memory_info().vms
-        # resident state memory used by process
-        proc_rss = process.memory_info().rss
-        cpu_proc = min(
-            [
-                round(
-                    process.cpu_percent(
-                        interval=proc_interval) / psutil.cpu_count(),
-                    2,
-                ),
-                cpu_percent,
-            ]
-        )
+        physical_mem, used_mem, used_mem_percent, swap_mem = reader.memory()
+        # virtual and resident state memory used by process
+        proc_vmem, proc_rss = reader.process_memory()
+        cgroup_stats = cls.cgroup.sample() if cls.cgroup is not None else {}
+        # usage is reported against the container limits if they are lower
+        # than the host resources
+        cpu_limit = cgroup_stats.get("cpu_limit")
+        if cpu_limit and cpu_limit < cpu_count:
+            cpu_count = max(1, math.ceil(cpu_limit))
+            cpu_percent = cgroup_stats.get("cpu_percent", cpu_percent)
+        else:
+            cpu_limit = cpu_count
+        memory_limit = cgroup_stats.get("memory_limit")
+        if memory_limit and memory_limit < physical_mem:
+            physical_mem = memory_limit
+            used_mem = cgroup_stats.get("memory_used", used_mem)
+            used_mem_percent = cgroup_stats.get(
+                "memory_percent", used_mem_percent)
+        cpu_proc = min(round(proc_cpu_load / cpu_limit, 2), cpu_percent)
 
         ps_stats = {
-            "cpu_count": psutil.cpu_count(),
+            "cpu_count": cpu_count,
             "cpu_percent": cpu_percent,
             "cpu_percent_percpu": cpu_load,
             "load_average": [load1, load5, load15],
-            "cpu_usage": (load15 / psutil.cpu_count()) * 100,
-            "used_ram_percent": psutil.virtual_memory()[2],
-            "used_ram_mb": psutil.virtual_memory()[3] / (1024 * 1024),
+            # load average is host wide
+            "cpu_usage": (load15 / reader.cpu_count) * 100,
+            "used_ram_percent": used_mem_percent,
+            "used_ram_mb": used_mem / (1024 * 1024),
         }
+        if cgroup_stats:
+            ps_stats["cgroup"] = cgroup_stats
 
         proc_stats = {
             # process cpu usage in % (per core)
@@ -98,13 +284,14 @@ class Collector:
                 },
             },
         }
+        # the process with its workers and subprocesses
+        proc_stats["tree"] = cls.process_tree().sample(cpu_limit)
         return ps_stats, proc_stats
 
     @classmethod
     def _collect_stats(cls):
-        cpu_interval, proc_interval = _TIME_INTERVALS
         gpu_stats = cls._gpu_stats()
-        ps_stats, ps_info = cls._ps_stats(cpu_interval, proc_interval)
+        ps_stats, ps_info = cls._ps_stats()
 
         return {
             "ps_stats": ps_stats,
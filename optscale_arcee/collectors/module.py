@@ -1,86 +1,177 @@
-import asyncio
+import ast
 import concurrent.futures
-import inspect
-from modulefinder import ModuleFinder
+import hashlib
+import json
+import logging
 import os
 import sys
+from importlib import metadata
+
 import __main__
 
 from optscale_arcee.utils import run_async
 
+LOG = logging.getLogger(__name__)
+
+
+def _default_cache_dir():
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache")
+    return os.path.join(root, "optscale_arcee")
+
 
 class Collector:
     executor = concurrent.futures.ThreadPoolExecutor(max_workers=3)
 
     """
-    Modules collector
+    Modules collector. Frameworks are detected by modules already loaded
+    and modules imported by the main script, versions are taken from
+    installed distributions
     """
 
-    __filter__ = [
-        "tf",  # Tensorflow
-        "torch",  # PyTorch
-        "sklearn",  # Scikit
-        "keras",  # Keras
-        "mxnet",  # MXNet
-        "numpy",  # NumPy
-        "scipy",  # SciPy
-        "sklearn",  # Scikit,
-        "theano",  # Theano
-        "pandas",  # Pandas
-    ]
+    # reported name: top level module
+    __filter__ = {
+        "tf": "tensorflow",  # Tensorflow
+        "torch": "torch",  # PyTorch
+        "sklearn": "sklearn",  # Scikit
+        "keras": "keras",  # Keras
+        "mxnet": "mxnet",  # MXNet
+        "numpy": "numpy",  # NumPy
+        "scipy": "scipy",  # SciPy
+        "theano": "theano",  # Theano
+        "pandas": "pandas",  # Pandas
+    }
+    # module versions are cached until site-packages directories change
+    cache_dir = _default_cache_dir()
 
     @staticmethod
-    async def get_cfp(real: bool = False) -> str:
-        frame = inspect.stack()[1]
-        p = frame[0].f_code.co_filename
-        if real:
-            return os.path.realpath(p)
-        return p
+    def _main_imports(file=None) -> set:
+        """
+        Top level modules imported by the main script, it's parsed only,
+        imported modules aren't followed
+        """
+        if file is None:
+            file = getattr(__main__, "__file__", None)
+        if not file:
+            return set()
+        try:
+            with open(file, "rb") as f:
+                tree = ast.parse(f.read(), file)
+        except (OSError, SyntaxError, ValueError):
+            return set()
+        modules = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                modules.update(a.name.partition(".")[0] for a in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                if not node.level:
+                    modules.add(node.module.partition(".")[0])
+        return modules
 
-    @classmethod
-    async def apply_filter(cls, modules):
-        result = list()
-        for i in cls.__filter__:
-            for j in modules:
-                if i in j:
-                    result.append(i)
-                    break
-        return result
+    @staticmethod
+    def _loaded_modules() -> set:
+        return {name.partition(".")[0] for name in list(sys.modules)}
 
     @staticmethod
-    def _fallback():
-        for m in sys.modules.values():
-            if m:
-                yield m.__name__
+    def _paths_key() -> list:
+        key = list()
+        for path in sys.path:
+            try:
+                key.append([path, os.stat(path or ".").st_mtime_ns])
+            except OSError:
+                continue
+        return key
+
+    @staticmethod
+    def _top_level_modules(dist) -> set:
+        top_level = dist.read_text("top_level.txt")
+        if top_level:
+            return set(top_level.split())
+        modules = set()
+        for file in dist.files or ():
+            parts = file.parts
+            if len(parts) > 1 and not parts[0].endswith(
+                    (".dist-info", ".egg-info")):
+                modules.add(parts[0])
+            elif file.suffix == ".py":
+                modules.add(file.stem)
+        return modules
 
     @classmethod
-    async def indirect(cls, file=None, use_cfp=False, f_simplify=True):
-        if file is None:
-            if not use_cfp:
-                file = __main__.__file__
-            else:
-                file = await cls.get_cfp()
+    def _distributions(cls) -> dict:
+        """
+        Maps top level modules to versions of installed distributions
+        """
+        versions = dict()
+        for dist in metadata.distributions():
+            try:
+                version = dist.version
+                modules = cls._top_level_modules(dist)
+            except Exception as exc:
+                LOG.debug("Failed to read distribution metadata: %r", exc)
+                continue
+            for module in modules:
+                # the first one on sys.path is imported
+                versions.setdefault(module, version)
+        return versions
+
+    @classmethod
+    def _cache_path(cls):
+        # environments are cached separately
+        digest = hashlib.sha1(sys.executable.encode("utf-8")).hexdigest()
+        return os.path.join(cls.cache_dir, "modules-%s.json" % digest[:16])
+
+    @classmethod
+    def _versions(cls) -> dict:
+        key = cls._paths_key()
+        path = cls._cache_path()
+        try:
+            with open(path) as f:
+                cache = json.load(f)
+            if cache["key"] == key:
+                return cache["versions"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        versions = cls._distributions()
         try:
-            finder = ModuleFinder()
-            await run_async(finder.run_script, file, executor=cls.executor)
-            m = finder.modules.keys()
-        except (AttributeError, RecursionError):
-            # try to bypass 40350/84530 ns mod issue
-            # pls see following for details
-
-            # https://bugs.python.org/issue40350
-            # https://github.com/python/cpython/issues/84530
-            # https://github.com/python/cpython/pull/19917
-            # https://github.com/python/cpython/pull/29196
-            m = await run_async(cls._fallback, executor=cls.executor)
-        if f_simplify:
-            mods = await cls.apply_filter(m)
-        else:
-            mods = m
-        for name in mods:
-            await asyncio.sleep(0)
-            yield name
+            os.makedirs(cls.cache_dir, exist_ok=True)
+            tmp_path = "%s.%s.tmp" % (path, os.getpid())
+            with open(tmp_path, "w") as f:
+                json.dump({"key": key, "versions": versions}, f)
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            LOG.debug("Failed to cache module versions: %r", exc)
+        return versions
+
+    @classmethod
+    def _used(cls, file=None) -> dict:
+        """
+        :return: (dict) top level modules of used frameworks by reported
+        names
+        """
+        modules = cls._loaded_modules() | cls._main_imports(file)
+        return {name: module for name, module in cls.__filter__.items()
+                if module in modules}
+
+    @classmethod
+    def _collect(cls, file=None) -> dict:
+        """
+        :return: (dict) reported names of used frameworks and their
+        versions, None if version is unknown
+        """
+        used = cls._used(file)
+        if not used:
+            return dict()
+        versions = cls._versions()
+        return {name: versions.get(module) for name, module in used.items()}
+
+    @classmethod
+    async def get_inventory(cls, file=None):
+        return await run_async(cls._collect, file, executor=cls.executor)
 
     @classmethod
-    async def get_imports(cls):
-        return [i async for i in cls.indirect()]
+    async def get_imports(cls, file=None):
+        """
+        Names of used frameworks, installed distributions are not read
+        """
+        return list(await run_async(cls._used, file, executor=cls.executor))
@@ -0,0 +1,166 @@
+import logging
+import os
+import threading
+import time
+
+import psutil
+
+LOG = logging.getLogger(__name__)
+
+ROLES = ("main", "worker", "subprocess")
+
+
+class ProcessTree:
+    """
+    Tracks the process and its descendants: dataloader and multiprocessing
+    workers (python processes) and other subprocesses. On Linux children
+    are discovered through /proc/<pid>/task/<tid>/children of tracked
+    processes only, otherwise the process table is scanned once per
+    discovery_interval seconds
+    """
+    discovery_interval = 5
+
+    def __init__(self, pid=None, procfs_root="/proc", reader=None):
+        """
+        :param pid: root process of the tree, the current one by default
+        :param procfs_root: procfs mount point
+        :param reader: hardware reader of the current process, cpu time and
+        memory of the root process are taken from it if it is the current
+        one instead of reading them again with psutil
+        """
+        self.pid = pid if pid is not None else os.getpid()
+        self.procfs_root = procfs_root
+        self.reader = reader if self.pid == os.getpid() else None
+        self._lock = threading.Lock()
+        root = psutil.Process(self.pid)
+        self._exe = self._exe_of(root)
+        # pid: (process, role, cpu seconds at the previous sample)
+        self._processes = {self.pid: (root, "main", None)}
+        # kernels built without CONFIG_PROC_CHILDREN have no children files
+        self._children_files = os.path.exists(os.path.join(
+            procfs_root, str(self.pid), "task", str(self.pid), "children"))
+        self._discovered_at = None
+        self._sampled_at = None
+
+    @staticmethod
+    def _exe_of(process):
+        try:
+            return process.exe()
+        except psutil.Error:
+            return None
+
+    def _role(self, process):
+        try:
+            with process.oneshot():
+                exe, cmdline = self._exe_of(process), process.cmdline()
+        except psutil.Error:
+            return "subprocess"
+        if (exe and exe == self._exe) or any(
+                "multiprocessing" in arg for arg in cmdline):
+            return "worker"
+        return "subprocess"
+
+    def _procfs_children(self, pid):
+        task_dir = os.path.join(self.procfs_root, str(pid), "task")
+        children = list()
+        try:
+            tasks = os.listdir(task_dir)
+        except OSError:
+            return children
+        for tid in tasks:
+            try:
+                with open(os.path.join(task_dir, tid, "children")) as f:
+                    children.extend(int(child) for child in f.read().split())
+            except OSError:
+                continue
+        return children
+
+    def _descendant_pids(self, now):
+        if self._children_files:
+            pids, queue = set(), [self.pid]
+            while queue:
+                for child in self._procfs_children(queue.pop()):
+                    if child not in pids:
+                        pids.add(child)
+                        queue.append(child)
+            return pids
+        if self._discovered_at is not None and (
+                now - self._discovered_at < self.discovery_interval):
+            return None
+        self._discovered_at = now
+        try:
+            root = self._processes[self.pid][0]
+            return {child.pid for child in root.children(recursive=True)}
+        except psutil.Error:
+            return None
+
+    def _discover(self, now):
+        pids = self._descendant_pids(now)
+        if pids is None:
+            return
+        for pid in list(self._processes):
+            if pid != self.pid and pid not in pids:
+                del self._processes[pid]
+        for pid in pids - set(self._processes):
+            try:
+                process = psutil.Process(pid)
+            except psutil.Error:
+                continue
+            self._processes[pid] = (process, self._role(process), None)
+
+    def _usage(self, pid, process):
+        """
+        :return: (float, int, int) cpu seconds, resident and virtual memory
+        of the process
+        """
+        if pid == self.pid and self.reader is not None:
+            vms, rss = self.reader.process_memory()
+            return self.reader.process_cpu_time(), rss, vms
+        with process.oneshot():
+            cpu_times = process.cpu_times()
+            memory = process.memory_info()
+        return cpu_times.user + cpu_times.system, memory.rss, memory.vms
+
+    def sample(self, cpu_count=None):
+        """
+        :param cpu_count: cpu usage is divided by it
+        :return: (dict) number of processes, cpu usage percent and memory
+        of the whole tree and of every role. Memory shared by forked
+        processes is counted in every one of them
+        """
+        cpu_count = cpu_count or psutil.cpu_count() or 1
+        with self._lock:
+            now = time.monotonic()
+            self._discover(now)
+            elapsed = now - self._sampled_at if self._sampled_at else None
+            roles = {role: {"count": 0, "cpu_time": 0.0, "rss": 0, "vms": 0}
+                     for role in ROLES}
+            for pid, (process, role, prev_cpu) in list(
+                    self._processes.items()):
+                try:
+                    cpu, rss, vms = self._usage(pid, process)
+                except (psutil.Error, OSError, ValueError):
+                    if pid != self.pid:
+                        del self._processes[pid]
+                    continue
+                if prev_cpu is None:
+                    # processes found later are new, all their cpu time is
+                    # counted, the ones found on the first sample are the
+                    # baseline
+                    prev_cpu = 0.0 if elapsed is not None else cpu
+                self._processes[pid] = (process, role, cpu)
+                totals = roles[role]
+                totals["count"] += 1
+                totals["cpu_time"] += max(0.0, cpu - prev_cpu)
+                totals["rss"] += rss
+                totals["vms"] += vms
+            self._sampled_at = now
+        for totals in roles.values():
+            cpu_time = totals.pop("cpu_time")
+            totals["cpu"] = round(
+                cpu_time / elapsed * 100 / cpu_count, 2) if elapsed else 0.0
+        tree = {key: sum(r[key] for r in roles.values())
+                for key in ("count", "cpu", "rss", "vms")}
+        tree["cpu"] = round(tree["cpu"], 2)
+        tree["roles"] = roles
+        return tree
@@ -0,0 +1,117 @@
+import os
+import threading
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_BUFFER_SIZE = 64 * 1024
+
+
+class ProcfsReader:
+    """
+    Reads host and process stats from Linux procfs. Files are opened once
+    and read from the start into a single reused buffer, fields are parsed
+    from bytes without decoding
+    """
+
+    def __init__(self, root="/proc", pid=None):
+        """
+        :param root: procfs mount point
+        :param pid: process to read, the current one by default
+        """
+        self.root = root
+        self._own_pid = pid is None
+        self.pid = pid if pid is not None else os.getpid()
+        self._lock = threading.Lock()
+        self._buffer = bytearray(_BUFFER_SIZE)
+        self._view = memoryview(self._buffer)
+        self._fds = dict()
+        self.cpu_count = os.cpu_count() or 1
+
+    @classmethod
+    def available(cls, root="/proc"):
+        return all(os.access(os.path.join(root, name), os.R_OK)
+                   for name in ("stat", "meminfo", "loadavg", "self/statm"))
+
+    def _read(self, name) -> bytes:
+        with self._lock:
+            if self._own_pid and self.pid != os.getpid():
+                # a forked child reads its own files
+                self._close()
+                self.pid = os.getpid()
+            fd = self._fds.get(name)
+            if fd is None:
+                path = os.path.join(self.root, name.format(pid=self.pid))
+                fd = self._fds[name] = os.open(path, os.O_RDONLY)
+            size = os.preadv(fd, [self._buffer], 0)
+            return self._view[:size].tobytes()
+
+    def cpu_times(self):
+        """
+        :return: list of busy and total seconds of every cpu
+        """
+        result = list()
+        for line in self._read("stat").split(b"\n")[1:]:
+            if not line.startswith(b"cpu"):
+                break
+            values = [int(v) for v in line.split()[1:]]
+            # user nice system idle iowait irq softirq steal guest guest_nice,
+            # guest time is already counted in user time
+            total = sum(values[:8])
+            busy = total - values[3] - (values[4] if len(values) > 4 else 0)
+            result.append((busy / _CLOCK_TICKS, total / _CLOCK_TICKS))
+        return result
+
+    def _process_stat(self):
+        data = self._read("{pid}/stat")
+        # the command name may contain spaces and parentheses
+        return data[data.rindex(b")") + 2:].split()
+
+    def process_cpu_time(self) -> float:
+        fields = self._process_stat()
+        # utime and stime, fields 14 and 15 counted from the pid
+        return (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+
+    def process_age(self) -> float:
+        start = int(self._process_stat()[19]) / _CLOCK_TICKS
+        uptime = float(self._read("uptime").split()[0])
+        return max(0.0, uptime - start)
+
+    def process_memory(self):
+        """
+        :return: (int, int) virtual and resident memory in bytes
+        """
+        size, resident = self._read("{pid}/statm").split()[:2]
+        return int(size) * _PAGE_SIZE, int(resident) * _PAGE_SIZE
+
+    def memory(self):
+        """
+        :return: (int, int, float, int) total, used bytes and used percent
+        of physical memory and total swap bytes, used memory is total minus
+        available, as psutil counts it
+        """
+        fields = dict()
+        for line in self._read("meminfo").split(b"\n"):
+            parts = line.split()
+            if len(parts) > 1:
+                fields[parts[0]] = int(parts[1]) * 1024
+        total = fields[b"MemTotal:"]
+        available = fields.get(b"MemAvailable:")
+        if not available:
+            available = fields[b"MemFree:"] + fields.get(
+                b"Buffers:", 0) + fields.get(b"Cached:", 0)
+        available = min(available, total)
+        used = total - available
+        percent = round(used / total * 100, 1) if total else 0.0
+        return total, used, percent, fields.get(b"SwapTotal:", 0)
+
+    def loadavg(self):
+        return tuple(float(v) for v in self._read("loadavg").split()[:3])
+
+    def _close(self):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+
+    def close(self):
+        with self._lock:
+            self._close()
@@ -0,0 +1,168 @@
+import logging
+import math
+import threading
+import time
+from array import array
+
+from optscale_arcee.collectors.hardware import Collector
+
+LOG = logging.getLogger(__name__)
+
+
+def _numeric(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _flatten(stats, prefix="", result=None):
+    """
+    Numeric values of nested stats by dotted keys. Lists are skipped except
+    per-device columns, a dict with an "index" list, their values are keyed
+    by device index, e.g. gpu_stats.gpus.load.3
+    """
+    if result is None:
+        result = dict()
+    indexes = stats.get("index")
+    if not isinstance(indexes, list):
+        indexes = None
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            _flatten(value, "%s%s." % (prefix, key), result)
+        elif _numeric(value):
+            result[prefix + key] = value
+        elif indexes is not None and key != "index" and isinstance(
+                value, list) and len(value) == len(indexes):
+            for index, item in zip(indexes, value):
+                if _numeric(item):
+                    result["%s%s.%s" % (prefix, key, index)] = item
+    return result
+
+
+def _percentile(values, percent):
+    """
+    Nearest-rank percentile of sorted values
+    """
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[rank - 1]
+
+
+class RingBuffer:
+    """
+    Keeps the last capacity samples of metrics in arrays of doubles, a
+    metric missing in a sample is kept as nan
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._columns = dict()
+        # index of the next sample and number of samples kept
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, values):
+        """
+        :param values: dict of metric names and numeric values
+        """
+        for name in values:
+            if name not in self._columns:
+                self._columns[name] = array("d", [math.nan] * self.capacity)
+        for name, column in self._columns.items():
+            column[self._next] = values.get(name, math.nan)
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
+
+    def _ordered(self, column):
+        start = (self._next - self._count) % self.capacity
+        if start + self._count <= self.capacity:
+            return column[start:start + self._count]
+        return column[start:] + column[:self._next]
+
+    def summary(self) -> dict:
+        """
+        :return: (dict) min, max, mean, p50, p95 and last value of every
+        metric
+        """
+        result = dict()
+        for name, column in self._columns.items():
+            values = [v for v in self._ordered(column) if not math.isnan(v)]
+            if not values:
+                continue
+            last = values[-1]
+            values.sort()
+            result[name] = {
+                "min": values[0],
+                "max": values[-1],
+                "mean": sum(values) / len(values),
+                "p50": _percentile(values, 50),
+                "p95": _percentile(values, 95),
+                "last": last,
+            }
+        return result
+
+
+class Sampler(threading.Thread):
+    """
+    Collects hardware stats every interval seconds. A report is the last
+    sample with aggregates of the samples taken since the previous report,
+    so spikes between reports are visible
+    """
+    interval = 0.5
+    # samples kept per report window, the oldest ones are overwritten
+    capacity = 1024
+
+    def __init__(self, interval=None, capacity=None, collect=None):
+        """
+        :param collect: function returning stats, hardware stats by default
+        """
+        threading.Thread.__init__(self, name="arcee-sampler", daemon=True)
+        if interval is not None:
+            self.interval = interval
+        if capacity is not None:
+            self.capacity = capacity
+        self._collect = collect or Collector._collect_stats
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._last = None
+        self.window = RingBuffer(self.capacity)
+
+    def sample(self):
+        stats = self._collect()
+        values = _flatten(stats)
+        with self._lock:
+            self._last = stats
+            self.window.append(values)
+
+    def run(self):
+        next_run = time.monotonic()
+        while not self._stopped.is_set():
+            try:
+                self.sample()
+            except Exception as exc:
+                LOG.warning("Failed to collect hardware stats: %r", exc)
+            next_run = max(next_run + self.interval, time.monotonic())
+            self._stopped.wait(next_run - time.monotonic())
+
+    def report(self):
+        """
+        Returns the last sample with "aggregates" of the window and starts
+        a new window
+        :return: (dict) stats or None if nothing was sampled yet
+        """
+        with self._lock:
+            if self._last is None:
+                return None
+            stats = dict(self._last)
+            stats["aggregates"] = self.window.summary()
+            self.window.clear()
+        return stats
+
+    def stop(self):
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
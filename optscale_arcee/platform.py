@@ -2,11 +2,17 @@ import platform
 import aiohttp
 import asyncio
 import aiofiles
+import contextlib
 import json
+import logging
+import time
 from enum import Enum
 
 from optscale_arcee.platforms_meta.azure import AzureMeta
 
+LOG = logging.getLogger(__name__)
+_MISSING = object()
+
 
 def serialise(self) -> dict:
     result = dict()
@@ -57,7 +63,7 @@ class PlatformMeta:
         self.availability_zone = availability_zone
 
     def to_dict(self) -> dict:
-        return json.loads(json.dumps(self, default=serialise))
+        return serialise(self)
 
 
 class Platform:
@@ -121,12 +127,71 @@ class Platform:
 
 
 class BaseCollector:
-    @staticmethod
+    # seconds to wait for a single metadata field
+    field_timeout = 2
+
+    def __init__(self):
+        self.session = None
+
+    @contextlib.asynccontextmanager
+    async def shared_session(self):
+        """
+        Yields the session shared by concurrent metadata requests, it's
+        opened by the outermost caller
+        """
+        if self.session is not None:
+            yield self.session
+            return
+        async with aiohttp.ClientSession() as session:
+            self.session = session
+            try:
+                yield session
+            finally:
+                self.session = None
+
+    async def _get_field(self, name, getter):
+        try:
+            return name, await asyncio.wait_for(getter(), self.field_timeout)
+        except Exception as exc:
+            LOG.debug("Failed to get platform field %s: %r", name, exc)
+            return name, None
+
+    async def gather_fields(self, getters) -> dict:
+        """
+        Runs metadata getters concurrently over one session
+        :param getters: dict of field names and getter coroutine functions
+        :return: (dict) fields which were received in time
+        """
+        async with self.shared_session():
+            results = await asyncio.gather(*[
+                self._get_field(name, getter)
+                for name, getter in getters.items()
+            ])
+        return {name: value for name, value in results if value is not None}
+
+    async def refresh(self, meta, fields) -> PlatformMeta:
+        """
+        Re-reads the given fields of previously collected meta
+        :param meta: (PlatformMeta) meta to update
+        :param fields: PlatformMeta attribute names, e.g. public_ip
+        :return: (PlatformMeta) updated meta
+        """
+        getters = dict()
+        for field in fields:
+            getter = getattr(self, "get_%s" % field, None)
+            if getter is not None:
+                getters[field] = getter
+        for field, value in (await self.gather_fields(getters)).items():
+            setattr(meta, field, value)
+        return meta
+
     async def send_request(
-        url, headers=None, params=None, response="text"
+        self, url, headers=None, params=None, response="text"
     ) -> str:
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(url, params=params) as resp:
+        async with self.shared_session() as session:
+            async with session.get(
+                url, headers=headers, params=params, raise_for_status=True
+            ) as resp:
                 if response == "json":
                     resp = await resp.json()
                 else:
@@ -136,37 +201,87 @@ class BaseCollector:
 
 class AwsCollector(BaseCollector):
     base_url = "http://169.254.169.254/latest/meta-data/%s"
+    token_url = "http://169.254.169.254/latest/api/token"
+    token_header = "X-aws-ec2-metadata-token"
+    token_ttl = 21600
+    # refresh the token this many seconds before it expires
+    token_refresh_margin = 60
+    # IMDSv1 is used for this many seconds if a token can't be retrieved
+    token_retry_interval = 300
+    token_timeout = 1
+    # IMDSv2 token is shared by all collector instances
+    _token = None
+    _token_expires_at = 0
+
+    def __init__(self):
+        super().__init__()
+        self._token_lock = None
+
+    async def get_token(self, session, stale=_MISSING):
+        """
+        Returns cached IMDSv2 token, requests a new one if the cached token
+        expires soon or was rejected by IMDS
+        :param session: aiohttp session
+        :param stale: token rejected by IMDS
+        :return: (str) token or None if IMDSv2 isn't available
+        """
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            cls = AwsCollector
+            now = time.monotonic()
+            if now < cls._token_expires_at and cls._token != stale:
+                return cls._token
+            token = await self.get_metadata_token(
+                session, self.token_ttl, self.token_url, self.token_timeout)
+            if token:
+                expires_in = self.token_ttl - self.token_refresh_margin
+            else:
+                expires_in = self.token_retry_interval
+            cls._token = token
+            cls._token_expires_at = now + expires_in
+            return token
 
-    @staticmethod
     async def send_request(
-            url, headers=None, params=None, response="text"
+            self, url, headers=None, params=None, response="text"
     ) -> str:
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(url, params=params) as resp:
-                if resp.status == 401:  # Handle Unauthorized error
-                    # Request a token for IMDSv2
-                    token = await AwsCollector.get_metadata_token(session)
-                    if token:
-                        headers = headers or {}
-                        headers["X-aws-ec2-metadata-token"] = token
-                        return await AwsCollector.send_request(
-                            url, headers, params, response)
-                    else:
+        async with self.shared_session() as session:
+            token = await self.get_token(session)
+            for retry in (True, False):
+                request_headers = dict(headers or {})
+                if token:
+                    request_headers[self.token_header] = token
+                async with session.get(
+                    url, headers=request_headers, params=params
+                ) as resp:
+                    if resp.status == 401 and retry:
+                        # token is expired or IMDSv2 is enforced
+                        token = await self.get_token(session, stale=token)
+                        if token:
+                            continue
                         raise Exception(
                             "Failed to retrieve IMDSv2 metadata token")
-
-                if response == "json":
-                    return await resp.json()
-                return await resp.text()
+                    resp.raise_for_status()
+                    if response == "json":
+                        return await resp.json()
+                    return await resp.text()
 
     @staticmethod
-    async def get_metadata_token(session, ttl=21600):
-        token_url = "http://169.254.169.254/latest/api/token"
+    async def get_metadata_token(
+            session, ttl=21600,
+            token_url="http://169.254.169.254/latest/api/token", timeout=1
+    ):
         headers = {"X-aws-ec2-metadata-token-ttl-seconds": "%s" % ttl}
-        async with session.put(token_url, headers=headers) as token_resp:
-            if token_resp.status == 200:
-                return await token_resp.text()
-            return None
+        try:
+            async with session.put(
+                token_url, headers=headers,
+                timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as token_resp:
+                if token_resp.status == 200:
+                    return await token_resp.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        return None
 
     async def get_instance_id(self):
         return await self.send_request(
@@ -215,17 +330,17 @@ class AwsCollector(BaseCollector):
         )
 
     async def get_platform_meta(self):
-        return PlatformMeta(
-            PlatformType.aws,
-            await self.get_instance_id(),
-            await self.get_account_id(),
-            await self.get_local_ip(),
-            await self.get_public_ip(),
-            await self.get_life_cycle(),
-            await self.get_instance_type(),
-            await self.get_region(),
-            await self.get_az(),
-        )
+        fields = await self.gather_fields({
+            "instance_id": self.get_instance_id,
+            "account_id": self.get_account_id,
+            "local_ip": self.get_local_ip,
+            "public_ip": self.get_public_ip,
+            "instance_lc": self.get_life_cycle,
+            "instance_type": self.get_instance_type,
+            "instance_region": self.get_region,
+            "availability_zone": self.get_az,
+        })
+        return PlatformMeta(PlatformType.aws, **fields)
 
 
 class GcpCollector(BaseCollector):
@@ -285,16 +400,19 @@ class GcpCollector(BaseCollector):
         return region, zone
 
     async def get_platform_meta(self):
-        return PlatformMeta(
-            PlatformType.gcp,
-            await self.get_instance_id(),
-            await self.get_account_id(),
-            await self.get_local_ip(),
-            await self.get_public_ip(),
-            await self.get_life_cycle(),
-            await self.get_instance_type(),
-            *(await self.get_locations())
-        )
+        fields = await self.gather_fields({
+            "instance_id": self.get_instance_id,
+            "account_id": self.get_account_id,
+            "local_ip": self.get_local_ip,
+            "public_ip": self.get_public_ip,
+            "instance_lc": self.get_life_cycle,
+            "instance_type": self.get_instance_type,
+            "locations": self.get_locations,
+        })
+        locations = fields.pop("locations", None)
+        if locations:
+            fields["instance_region"], fields["availability_zone"] = locations
+        return PlatformMeta(PlatformType.gcp, **fields)
 
 
 class AzureCollector(BaseCollector):
@@ -338,19 +456,28 @@ class AzureCollector(BaseCollector):
             )
         return PlatformMeta(PlatformType.azure)
 
+    async def refresh(self, meta, fields) -> PlatformMeta:
+        # all fields are returned by a single request
+        fresh = await self.get_platform_meta()
+        for field in fields:
+            setattr(meta, field, getattr(fresh, field))
+        return meta
+
 
 class AlibabaCollector(BaseCollector):
     base_url = "http://100.100.100.200/latest/meta-data/%s"
 
-    @staticmethod
     async def send_request(
-        url, headers=None, params=None, response="text"
+        self, url, headers=None, params=None, response="text"
     ) -> str:
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(url, params=params) as resp:
+        async with self.shared_session() as session:
+            async with session.get(
+                url, headers=headers, params=params
+            ) as resp:
                 if resp.status == 404:
                     resp = ""
                 else:
+                    resp.raise_for_status()
                     resp = await resp.text()
                 return resp
 
@@ -404,17 +531,17 @@ class AlibabaCollector(BaseCollector):
         )
 
     async def get_platform_meta(self):
-        return PlatformMeta(
-            PlatformType.alibaba,
-            await self.get_instance_id(),
-            await self.get_account_id(),
-            await self.get_local_ip(),
-            await self.get_public_ip(),
-            await self.get_life_cycle(),
-            await self.get_instance_type(),
-            await self.get_region(),
-            await self.get_az(),
-        )
+        fields = await self.gather_fields({
+            "instance_id": self.get_instance_id,
+            "account_id": self.get_account_id,
+            "local_ip": self.get_local_ip,
+            "public_ip": self.get_public_ip,
+            "instance_lc": self.get_life_cycle,
+            "instance_type": self.get_instance_type,
+            "instance_region": self.get_region,
+            "availability_zone": self.get_az,
+        })
+        return PlatformMeta(PlatformType.alibaba, **fields)
 
 
 class UnknownCollector(BaseCollector):
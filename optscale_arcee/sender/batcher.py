@@ -0,0 +1,91 @@
+import asyncio
+import collections
+import logging
+
+LOG = logging.getLogger(__name__)
+
+
+class MetricsBatcher:
+    """
+    Buffers metric points and flushes them in batches from the loop thread.
+    A batch is flushed once max_size points are queued or every max_age
+    seconds, whichever comes first
+    """
+    max_size = 100
+    max_age = 1.0
+
+    def __init__(self, flush_cb, max_size=None, max_age=None):
+        """
+        :param flush_cb: coroutine function sending a list of points
+        """
+        self._flush_cb = flush_cb
+        if max_size is not None:
+            self.max_size = max_size
+        if max_age is not None:
+            self.max_age = max_age
+        # deque appends are thread safe, points are put from any thread
+        self._points = collections.deque()
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self._stopped = False
+        self._closed = False
+
+    def __len__(self):
+        return len(self._points)
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    def put(self, point):
+        if self._closed:
+            # there is no run to send points to
+            return
+        self._points.append(point)
+        if len(self._points) >= self.max_size and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _drain(self):
+        points = list()
+        while self._points and len(points) < self.max_size:
+            points.append(self._points.popleft())
+        return points
+
+    async def flush(self):
+        while self._points:
+            points = self._drain()
+            try:
+                await self._flush_cb(points)
+            except Exception as exc:
+                LOG.warning("Failed to send %s metric points: %s",
+                            len(points), exc)
+
+    async def _run(self):
+        while not self._stopped:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.max_age)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def close(self):
+        """
+        Drops queued points and points put later, e.g. if the run wasn't
+        created
+        """
+        self._closed = True
+        self._points.clear()
+
+    async def stop(self):
+        """
+        Stops the background flusher and sends all queued points
+        """
+        self._stopped = True
+        if self._task is not None:
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+
+LOG = logging.getLogger(__name__)
+
+
+class PatchCoalescer:
+    """
+    Merges PATCH bodies per resource and sends one request per resource
+    once no updates came for debounce seconds, but no later than max_delay
+    seconds after the first pending update
+    """
+    debounce = 0.5
+    max_delay = 5
+
+    def __init__(self, send_cb, debounce=None, max_delay=None):
+        """
+        :param send_cb: coroutine function sending (url, headers, body)
+        """
+        self._send_cb = send_cb
+        if debounce is not None:
+            self.debounce = debounce
+        if max_delay is not None:
+            self.max_delay = max_delay
+        # url: (headers, merged body), dicts keep update order
+        self._pending = dict()
+        self._first_update_at = None
+        self._timer = None
+        self._lock = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def update(self, url, headers, body):
+        """
+        Merges body fields into the pending PATCH of url, must be called
+        from the loop thread
+        """
+        if url not in self._pending:
+            self._pending[url] = (headers, dict())
+        self._pending[url][1].update(body)
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self._first_update_at is None:
+            self._first_update_at = now
+        if self._timer is not None:
+            self._timer.cancel()
+        delay = min(self.debounce,
+                    max(0, self._first_update_at + self.max_delay - now))
+        self._timer = loop.call_later(delay, self._flush_later)
+
+    def _flush_later(self):
+        self._timer = None
+        asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """
+        Sends all pending updates
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # previous flush must complete first to keep updates ordered
+        async with self._lock:
+            pending, self._pending = self._pending, dict()
+            self._first_update_at = None
+            for url, (headers, body) in pending.items():
+                try:
+                    await self._send_cb(url, headers, body)
+                except Exception as exc:
+                    LOG.warning("Failed to send update of %s: %s", url, exc)
@@ -0,0 +1,70 @@
+import gzip
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _gzip(data, level=None):
+    return gzip.compress(data, compresslevel=6 if level is None else level)
+
+
+def _deflate(data, level=None):
+    return zlib.compress(data, -1 if level is None else level)
+
+
+def _zstd(data, level=None):
+    return zstandard.ZstdCompressor(
+        level=3 if level is None else level).compress(data)
+
+
+def _gzip_stream(level=None):
+    # gzip container
+    return zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 31)
+
+
+def _deflate_stream(level=None):
+    return zlib.compressobj(-1 if level is None else level)
+
+
+def _zstd_stream(level=None):
+    return zstandard.ZstdCompressor(
+        level=3 if level is None else level).compressobj()
+
+
+# Content-Encoding and compression function
+CODECS = {
+    "gzip": _gzip,
+    "deflate": _deflate,
+    "zstd": _zstd,
+}
+# Content-Encoding and function creating a compressor of a stream with
+# compress and flush methods
+STREAM_CODECS = {
+    "gzip": _gzip_stream,
+    "deflate": _deflate_stream,
+    "zstd": _zstd_stream,
+}
+
+
+def get_codec(name):
+    """
+    Returns compression function for Content-Encoding name
+    :param name: gzip, deflate or zstd
+    """
+    if name not in CODECS:
+        raise ValueError("Unsupported compression: %s" % name)
+    if name == "zstd" and zstandard is None:
+        raise ValueError("zstd compression requires zstandard package")
+    return CODECS[name]
+
+
+def get_stream_codec(name):
+    """
+    Returns function creating a compressor for Content-Encoding name
+    :param name: gzip, deflate or zstd
+    """
+    get_codec(name)
+    return STREAM_CODECS[name]
@@ -0,0 +1,117 @@
+import asyncio
+import random
+import time
+from urllib.parse import urlparse
+
+import aiohttp
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised without sending a request while the circuit breaker is open
+    """
+
+
+class RetryPolicy:
+    """
+    Decides whether a failed request is retried and how long to wait.
+    Requests which could have been processed by the server are retried only
+    if they are idempotent
+    """
+    max_attempts = 4
+    base_delay = 0.5
+    max_delay = 30
+    idempotent_methods = ("GET", "HEAD", "PUT", "PATCH", "DELETE")
+    # POST endpoints which are safe to repeat (heartbeats)
+    idempotent_post_paths = ("/proc",)
+    # responses sent before the request was processed
+    retry_statuses = (429, 503)
+
+    def __init__(self, max_attempts=None, base_delay=None, max_delay=None):
+        if max_attempts is not None:
+            self.max_attempts = max_attempts
+        if base_delay is not None:
+            self.base_delay = base_delay
+        if max_delay is not None:
+            self.max_delay = max_delay
+
+    def delay(self, attempt) -> float:
+        """
+        Exponential backoff with full jitter
+        :param attempt: number of failed attempts
+        :return: (float) seconds to wait
+        """
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def is_idempotent(self, method, url) -> bool:
+        if method.upper() in self.idempotent_methods:
+            return True
+        path = urlparse(url).path
+        return any(path.endswith(p) for p in self.idempotent_post_paths)
+
+    @staticmethod
+    def is_failure(exc) -> bool:
+        """
+        Whether exception means the endpoint is unavailable
+        """
+        if isinstance(exc, aiohttp.ClientResponseError):
+            return exc.status >= 500 or exc.status == 429
+        return isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError))
+
+    def is_retryable(self, method, url, exc) -> bool:
+        if isinstance(exc, aiohttp.ClientConnectorError):
+            # connection wasn't established, request wasn't sent
+            return True
+        if isinstance(exc, aiohttp.ClientResponseError):
+            if exc.status in self.retry_statuses:
+                return True
+            if exc.status < 500:
+                return False
+        return self.is_failure(exc) and self.is_idempotent(method, url)
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures. While open requests
+    fail fast, after reset_timeout seconds a single trial request is allowed
+    and its result closes or reopens the breaker
+    """
+    failure_threshold = 5
+    reset_timeout = 30
+
+    def __init__(self, failure_threshold=None, reset_timeout=None):
+        if failure_threshold is not None:
+            self.failure_threshold = failure_threshold
+        if reset_timeout is not None:
+            self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_at = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        now = time.monotonic()
+        # a trial request which never finished doesn't block forever
+        last_attempt = max(self.opened_at, self._trial_at or 0)
+        if now - last_attempt >= self.reset_timeout:
+            self._trial_at = now
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_at is not None or (
+                self.failures >= self.failure_threshold):
+            self.opened_at = time.monotonic()
+        self._trial_at = None
@@ -1,6 +1,10 @@
+import asyncio
 import aiohttp
+import logging
 import threading
+from functools import partial
 
+from optscale_arcee import serializer
 from optscale_arcee.platform import CollectorFactory
 from optscale_arcee.collectors.command_line import (
     Collector as CommandCollector)
@@ -8,6 +12,12 @@ from optscale_arcee.collectors.git import Collector as GitCollector
 from optscale_arcee.collectors.hardware import Collector as HardwareCollector
 from optscale_arcee.collectors.module import Collector as ImportsCollector
 from optscale_arcee.collectors.console import Collector as OutCollector
+from optscale_arcee.sender.coalescer import PatchCoalescer
+from optscale_arcee.sender.compression import get_codec, get_stream_codec
+from optscale_arcee.sender.retry import (
+    CircuitBreaker, CircuitOpenError, RetryPolicy)
+
+LOG = logging.getLogger(__name__)
 
 
 def check_shutdown_flag_set(function):
@@ -18,21 +28,158 @@ def check_shutdown_flag_set(function):
     return inner
 
 
+class StreamingBody:
+    """
+    Request body sent in chunks, chunks function returns a new iterator of
+    bytes for every attempt
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+
 class Sender:
     # default OptScale url
     base_url = "https://my.optscale.com:443/arcee/v2"
-
-    def __init__(self, endpoint_url=None, ssl=True, shutdown_flag=None):
+    # connection pool defaults
+    conn_limit = 10
+    conn_limit_per_host = 10
+    dns_cache_ttl = 300
+    keepalive_timeout = 60
+    connect_timeout = 10
+    read_timeout = 60
+    # request bodies of this size and bigger are compressed
+    compress_threshold = 1024
+    compress_level = None
+    # bigger bodies are compressed in a worker thread
+    compress_offload_size = 1024 * 1024
+    # seconds between spool replay attempts while endpoint is unreachable
+    replay_interval = 5
+    # seconds to wait for spooled requests on close
+    spool_flush_timeout = 10
+    # seconds run creation waits for each run metadata collector, fields
+    # collected later are sent with a run update
+    metadata_timeouts = {
+        "imports": 1, "import_versions": 5, "git": 2, "command": 1}
+    # fields sent with a separate run update only, so an endpoint which
+    # doesn't support them rejects that update alone. Fields collected too
+    # late for run creation are sent with their own updates as well
+    update_metadata_fields = ("import_versions",)
+    # seconds late run metadata is waited for
+    late_metadata_timeout = 60
+    late_metadata_flush_timeout = 5
+    # request header with the profiling token
+    token_header = "x-api-key"
+
+    def __init__(self, endpoint_url=None, ssl=True, shutdown_flag=None,
+                 conn_limit=None, conn_limit_per_host=None, spool=None,
+                 retry_policy=None, circuit_breaker=None,
+                 compression=None):
         if endpoint_url is None:
             endpoint_url = self.base_url
         self.endpoint_url = endpoint_url
         self.shutdown_flag = shutdown_flag or threading.Event()
         self.ssl = ssl
-
-    @staticmethod
-    async def m():
-        platform = await CollectorFactory.get()
-        return await platform().get_platform_meta()
+        if conn_limit is not None:
+            self.conn_limit = conn_limit
+        if conn_limit_per_host is not None:
+            self.conn_limit_per_host = conn_limit_per_host
+        # aiohttp sessions are bound to the loop they were created in,
+        # so keep one pooled session per loop
+        self._sessions = dict()
+        # platform meta is detected once per run
+        self._platform_collector = None
+        self._platform_meta = None
+        self._platform_meta_dict = None
+        self._platform_lock = None
+        # request body Content-Encoding, None disables compression
+        self.compression = compression
+        self._compress = get_codec(compression) if compression else None
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        # optional write-ahead spool of outgoing requests
+        self.spool = spool
+        # token of the latest spooled request
+        self._spool_token = None
+        self._draining = False
+        self._replay_task = None
+        # tags, hyperparameters and model version updates are merged
+        self.patches = PatchCoalescer(partial(self.send_spooled, "PATCH"))
+        self._late_metadata_task = None
+
+    def _session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.conn_limit,
+                limit_per_host=self.conn_limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=None, sock_connect=self.connect_timeout,
+                sock_read=self.read_timeout)
+            session = aiohttp.ClientSession(
+                connector=connector, timeout=timeout)
+            self._sessions[loop] = session
+        return session
+
+    async def close(self):
+        """
+        Sends pending spool records and closes the pooled session of the
+        running loop
+        """
+        task = self._late_metadata_task
+        if task is not None and not task.done():
+            await asyncio.wait([task],
+                               timeout=self.late_metadata_flush_timeout)
+            task.cancel()
+        await self.patches.flush()
+        if self.spool is not None:
+            await self.flush_spool(self.spool_flush_timeout)
+            self.spool.close()
+            self.spool = None
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    async def m(self):
+        """
+        Returns platform meta, it's collected on the first call only
+        :return: (PlatformMeta) platform meta
+        """
+        if self._platform_meta is not None:
+            return self._platform_meta
+        if self._platform_lock is None:
+            self._platform_lock = asyncio.Lock()
+        async with self._platform_lock:
+            if self._platform_meta is None:
+                platform = await CollectorFactory.get()
+                self._platform_collector = platform()
+                meta = await self._platform_collector.get_platform_meta()
+                self._platform_meta_dict = meta.to_dict()
+                self._platform_meta = meta
+        return self._platform_meta
+
+    async def platform_meta(self) -> dict:
+        """
+        Returns cached platform meta in the form sent to the server
+        """
+        await self.m()
+        return self._platform_meta_dict
+
+    async def refresh_platform_meta(self, fields=("public_ip",)) -> dict:
+        """
+        Re-reads platform meta fields which may change during the run
+        :param fields: PlatformMeta attribute names
+        :return: (dict) updated platform meta
+        """
+        meta = await self.m()
+        async with self._platform_lock:
+            await self._platform_collector.refresh(meta, fields)
+            self._platform_meta_dict = meta.to_dict()
+        return self._platform_meta_dict
 
     @staticmethod
     async def _proc_data():
@@ -42,6 +189,10 @@ class Sender:
     async def _imports_data():
         return await ImportsCollector.get_imports()
 
+    @staticmethod
+    async def _import_versions_data():
+        return await ImportsCollector.get_inventory()
+
     @staticmethod
     async def _git_data():
         return await GitCollector.collect()
@@ -54,84 +205,370 @@ class Sender:
     async def _output():
         return await OutCollector.collect()
 
+    async def _send_body(self, method, url, headers=None, body=None,
+                         params=None) -> dict:
+        async with self._session().request(
+            method, url, headers=headers, params=params, data=body,
+            raise_for_status=True, ssl=self.ssl
+        ) as response:
+            content = await response.read()
+            return serializer.loads(content) if content else None
+
+    async def _compressed(self, body) -> bytes:
+        if len(body) < self.compress_offload_size:
+            return self._compress(body, self.compress_level)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._compress, body, self.compress_level)
+
+    @staticmethod
+    def _encoded_chunks(body, compressor):
+        for chunk in body.chunks():
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+        if compressor is not None:
+            yield compressor.flush()
+
+    async def _stream(self, body, compress):
+        """
+        Chunks of the streaming body, read and compressed in a worker thread
+        """
+        compressor = get_stream_codec(self.compression)(
+            self.compress_level) if compress else None
+        chunks = self._encoded_chunks(body, compressor)
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk = await loop.run_in_executor(None, next, chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    async def _encoded(self, body, compress):
+        if isinstance(body, StreamingBody):
+            return self._stream(body, compress)
+        if compress:
+            return await self._compressed(body)
+        return body
+
+    async def _send_once(self, method, url, headers=None, data=None,
+                         params=None) -> dict:
+        if isinstance(data, StreamingBody):
+            body = data
+        else:
+            body = serializer.dumps(data) if data is not None else None
+        streaming = isinstance(body, StreamingBody)
+        compress = self._compress is not None and body is not None and (
+            streaming or len(body) >= self.compress_threshold)
+        if not compress:
+            return await self._send_body(
+                method, url, headers, await self._encoded(body, False),
+                params)
+        compressed_headers = dict(headers or {})
+        compressed_headers["Content-Encoding"] = self.compression
+        try:
+            return await self._send_body(
+                method, url, compressed_headers,
+                await self._encoded(body, True), params)
+        except aiohttp.ClientResponseError as exc:
+            if exc.status not in (400, 415):
+                raise
+        # endpoint may not support compressed bodies
+        result = await self._send_body(
+            method, url, headers, await self._encoded(body, False), params)
+        LOG.info("%s doesn't accept %s request bodies, compression is "
+                 "disabled", self.endpoint_url, self.compression)
+        self._compress = None
+        return result
+
+    async def send_request(self, method, url, headers=None, data=None,
+                           params=None) -> dict:
+        """
+        Sends request, transient failures are retried according to the
+        retry policy. Raises CircuitOpenError while the endpoint is
+        considered unavailable
+        """
+        attempt = 0
+        while True:
+            if not self.circuit_breaker.allow():
+                raise CircuitOpenError(
+                    "%s is unavailable, %s %s is not sent" % (
+                        self.endpoint_url, method, url))
+            try:
+                result = await self._send_once(
+                    method, url, headers, data, params)
+            except Exception as exc:
+                if not self.retry_policy.is_failure(exc):
+                    # endpoint responded
+                    self.circuit_breaker.record_success()
+                    raise
+                self.circuit_breaker.record_failure()
+                attempt += 1
+                if attempt >= self.retry_policy.max_attempts:
+                    raise
+                if not self.retry_policy.is_retryable(method, url, exc):
+                    raise
+                LOG.debug("Retrying %s %s after failure: %r",
+                          method, url, exc)
+                await asyncio.sleep(self.retry_policy.delay(attempt))
+            else:
+                self.circuit_breaker.record_success()
+                return result
+
     async def send_get_request(self, url, headers=None, params=None) -> dict:
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(
-                url, params=params, raise_for_status=True, ssl=self.ssl
-            ) as response:
-                return await response.json()
+        return await self.send_request("GET", url, headers, params=params)
 
     async def send_post_request(self, url, headers=None, data=None) -> dict:
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.post(
-                url, json=data, raise_for_status=True, ssl=self.ssl
-            ) as response:
-                return await response.json()
+        return await self.send_request("POST", url, headers, data)
 
     async def send_patch_request(self, url, headers=None, data=None) -> dict:
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.patch(
-                url, json=data, raise_for_status=True, ssl=self.ssl
-            ) as response:
-                return await response.json()
+        return await self.send_request("PATCH", url, headers, data)
+
+    def _spool_request(self, method, url, headers=None, data=None):
+        headers = dict(headers or {})
+        # the token isn't written to disk, the current one is added when
+        # the request is sent
+        token = headers.pop(self.token_header, None)
+        if token is not None:
+            self._spool_token = token
+        self.spool.append({
+            "method": method, "url": url, "headers": headers, "data": data
+        })
+
+    def _spooled_headers(self, record):
+        headers = dict(record["headers"] or {})
+        if self._spool_token is not None:
+            headers.setdefault(self.token_header, self._spool_token)
+        return headers
+
+    async def send_spooled(self, method, url, headers=None, data=None):
+        """
+        Sends request which response isn't needed. With spool enabled the
+        request is written to the spool first and sent in order once the
+        endpoint is reachable
+        """
+        if self.spool is None:
+            return await self.send_request(method, url, headers, data)
+        self._spool_request(method, url, headers, data)
+        await self._drain_or_replay()
+
+    async def _drain_or_replay(self):
+        if self._replay_task is not None:
+            # endpoint is unreachable, replayer sends the records later
+            return
+        if not await self.drain_spool():
+            self._replay_task = asyncio.ensure_future(self._replay())
+
+    async def drain_spool(self) -> bool:
+        """
+        Sends spooled requests in order
+        :return: (bool) False if endpoint is unreachable
+        """
+        if self._draining:
+            # records are picked up by the running drain
+            return True
+        self._draining = True
+        try:
+            while self.spool is not None:
+                record = self.spool.peek()
+                if record is None:
+                    break
+                try:
+                    await self.send_request(
+                        record["method"], record["url"],
+                        self._spooled_headers(record), record["data"])
+                except aiohttp.ClientResponseError as exc:
+                    if exc.status >= 500 or exc.status in (408, 429):
+                        return False
+                    LOG.warning("Dropping spooled %s %s request: %s",
+                                record["method"], record["url"], exc)
+                except (aiohttp.ClientError, asyncio.TimeoutError, OSError,
+                        CircuitOpenError):
+                    return False
+                except Exception as exc:
+                    # e.g. the response can't be decoded, the request was
+                    # accepted and mustn't block the following ones
+                    LOG.warning("Spooled %s %s request failed: %r",
+                                record["method"], record["url"], exc)
+                self.spool.pop()
+            return True
+        finally:
+            self._draining = False
+
+    async def _replay(self):
+        try:
+            while not await self.drain_spool():
+                await asyncio.sleep(self.replay_interval)
+        finally:
+            self._replay_task = None
+
+    async def flush_spool(self, timeout=None):
+        """
+        Waits for spooled requests to be sent
+        :param timeout: seconds to wait, records which were not sent are
+        left in the spool
+        """
+        if self._replay_task is not None:
+            self._replay_task.cancel()
+            self._replay_task = None
+        try:
+            await asyncio.wait_for(self.drain_spool(), timeout)
+        except asyncio.TimeoutError:
+            LOG.warning("Spooled requests were not sent, they are kept in %s",
+                        self.spool.path)
 
     @check_shutdown_flag_set
+    async def _run_metadata(self):
+        """
+        Runs run metadata collectors concurrently, each one is waited for
+        its time budget only
+        :return: (dict, dict) collected fields, tasks of fields which
+        weren't collected in time
+        """
+        collectors = {
+            "imports": self._imports_data,
+            "import_versions": self._import_versions_data,
+            "git": self._git_data,
+            "command": self._self_command,
+        }
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        tasks = {field: asyncio.ensure_future(collect())
+                 for field, collect in collectors.items()}
+        data, late = dict(), dict()
+        for field, task in tasks.items():
+            deadline = started_at + self.metadata_timeouts.get(field, 0)
+            await asyncio.wait([task], timeout=max(0, deadline - loop.time()))
+            if not task.done():
+                LOG.debug("Run %s is collected too long, it'll be sent later",
+                          field)
+                late[field] = task
+            elif task.exception() is not None:
+                LOG.warning("Failed to collect run %s: %r",
+                            field, task.exception())
+            else:
+                data[field] = task.result()
+        return data, late
+
+    async def _send_metadata_update(self, uri, headers, field, value):
+        # not merged with tags and hyperparameters updates, so an endpoint
+        # rejecting the field rejects this update alone
+        try:
+            await self.send_spooled("PATCH", uri, headers, {field: value})
+        except Exception as exc:
+            LOG.warning("Failed to send run %s: %r", field, exc)
+
+    async def _send_late_metadata(self, run_id, token, tasks, updates):
+        uri = "%s/run/%s" % (self.endpoint_url, run_id)
+        headers = {"x-api-key": token, "Content-Type": "application/json"}
+        for field, value in updates.items():
+            await self._send_metadata_update(uri, headers, field, value)
+        if tasks:
+            done, pending = await asyncio.wait(
+                tasks.values(), timeout=self.late_metadata_timeout)
+            for task in pending:
+                task.cancel()
+            for field, task in tasks.items():
+                if task in done and task.exception() is None:
+                    await self._send_metadata_update(
+                        uri, headers, field, task.result())
+                elif task in done:
+                    LOG.warning("Failed to collect run %s: %r",
+                                field, task.exception())
+
     async def get_run_id(self, task_key, token, run_name):
         uri = "%s/tasks/%s/run" % (self.endpoint_url, task_key)
         headers = {"x-api-key": token, "Content-Type": "application/json"}
-        data = {
-            "imports": await self._imports_data(),
-            "git": await self._git_data(),
-            "command": await self._self_command(),
-            "name": run_name
-        }
-        return await self.send_post_request(uri, headers, data)
+        data, late = await self._run_metadata()
+        updates = {field: data.pop(field)
+                   for field in self.update_metadata_fields if field in data}
+        data["name"] = run_name
+        try:
+            result = await self.send_post_request(uri, headers, data)
+        except Exception:
+            for task in late.values():
+                task.cancel()
+            raise
+        if late or updates:
+            self._late_metadata_task = asyncio.ensure_future(
+                self._send_late_metadata(result["id"], token, late, updates))
+        return result
 
     @check_shutdown_flag_set
     async def add_milestone(self, run_id, token, value):
         uri = "%s/run/%s/milestones" % (self.endpoint_url, run_id)
         headers = {"x-api-key": token, "Content-Type": "application/json"}
-        return await self.send_post_request(uri, headers, {"milestone": value})
+        await self.patches.flush()
+        return await self.send_spooled(
+            "POST", uri, headers, {"milestone": value})
 
     @check_shutdown_flag_set
     async def add_tags(self, run_id, token, tags):
         uri = "%s/run/%s" % (self.endpoint_url, run_id)
         headers = {"x-api-key": token, "Content-Type": "application/json"}
-        return await self.send_patch_request(uri, headers, {"tags": tags})
+        self.patches.update(uri, headers, {"tags": tags})
 
     @check_shutdown_flag_set
     async def change_state(self, run_id, token, state, finish=False):
         uri = "%s/run/%s" % (self.endpoint_url, run_id)
         headers = {"x-api-key": token, "Content-Type": "application/json"}
-        return await self.send_patch_request(
-            uri, headers, {"state": state, "finish": finish}
+        await self.patches.flush()
+        return await self.send_spooled(
+            "PATCH", uri, headers, {"state": state, "finish": finish}
         )
 
     @check_shutdown_flag_set
     async def create_stage(self, run_id, token, name):
         uri = "%s/run/%s/stages" % (self.endpoint_url, run_id)
         headers = {"x-api-key": token, "Content-Type": "application/json"}
-        return await self.send_post_request(uri, headers, {"stage": name})
+        await self.patches.flush()
+        return await self.send_spooled("POST", uri, headers, {"stage": name})
 
     @check_shutdown_flag_set
     async def send_stats(self, token, data):
         headers = {"x-api-key": token, "Content-Type": "application/json"}
-        meta = await self.m()
-        data.update({"platform": meta.to_dict()})
-        await self.send_post_request(
-            "%s/%s" % (self.endpoint_url, "collect"), headers, data
+        data.update({"platform": await self.platform_meta()})
+        await self.send_spooled(
+            "POST", "%s/%s" % (self.endpoint_url, "collect"), headers, data
         )
 
     @check_shutdown_flag_set
-    async def send_proc_data(self, run_id, token):
+    async def send_stats_batch(self, token, points):
+        """
+        Sends metric points collected by MetricsBatcher, platform meta
+        is fetched once per batch
+        """
+        uri = "%s/%s" % (self.endpoint_url, "collect")
+        headers = {"x-api-key": token, "Content-Type": "application/json"}
+        meta = await self.platform_meta()
+        if self.spool is not None:
+            for p in points:
+                self._spool_request(
+                    "POST", uri, headers, dict(p, platform=meta))
+            return await self._drain_or_replay()
+        results = await asyncio.gather(*[
+            self.send_post_request(uri, headers, dict(p, platform=meta))
+            for p in points
+        ], return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    @check_shutdown_flag_set
+    async def send_proc_data(self, run_id, token, sampler=None):
+        """
+        :param sampler: optional Sampler, its report is sent instead of a
+        single stats snapshot
+        """
         uri = "%s/run/%s/proc" % (self.endpoint_url, run_id)
         headers = {"x-api-key": token, "Content-Type": "application/json"}
         data = dict()
-        meta = await self.m()
-        proc = await self._proc_data()
-        data.update({"platform": meta.to_dict()})
+        proc = sampler.report() if sampler is not None else None
+        if proc is None:
+            proc = await self._proc_data()
+        data.update({"platform": await self.platform_meta()})
         data.update({"proc_stats": proc})
-        return await self.send_post_request(uri, headers, data)
+        return await self.send_spooled("POST", uri, headers, data)
 
     @staticmethod
     def generate_description(task_key, run_name, run_id):
@@ -157,22 +594,25 @@ class Sender:
             "description": description,
             "labels": labels or []
         }
-        await self.send_post_request(uri, headers, data)
+        await self.send_spooled("POST", uri, headers, data)
 
     @check_shutdown_flag_set
     async def add_hyperparams(self, run_id, token, hyperparams):
         uri = "%s/run/%s" % (self.endpoint_url, run_id)
         headers = {"x-api-key": token, "Content-Type": "application/json"}
-        return await self.send_patch_request(
-            uri, headers, {"hyperparameters": hyperparams}
-        )
+        self.patches.update(uri, headers, {"hyperparameters": hyperparams})
 
     async def send_console(self, run_id, token):
         uri = f"{self.endpoint_url}/run/{run_id}/consoles"
         headers = {"x-api-key": token, "Content-Type": "application/json"}
-
-        data = await self._output()
-        await self.send_post_request(uri, headers, data)
+        if self.spool is not None:
+            # spool records are json documents
+            data = await self._output()
+            await self.send_spooled("POST", uri, headers, data)
+            return
+        # the output is streamed from the capture buffers
+        await self.send_request(
+            "POST", uri, headers, StreamingBody(OutCollector.json_chunks))
 
     @check_shutdown_flag_set
     async def add_model(self, token, key):
@@ -187,13 +627,13 @@ class Sender:
         headers = {"x-api-key": token, "Content-Type": "application/json"}
         uri = f'{self.endpoint_url}/runs/{run_id}/models/{model_id}/version'
         body = {'path': path} if path else {}
-        await self.send_post_request(uri, headers, body)
+        await self.send_spooled("POST", uri, headers, body)
 
     @check_shutdown_flag_set
     async def patch_model_version(self, run_id, model_id, token, params):
         headers = {"x-api-key": token, "Content-Type": "application/json"}
         uri = f'{self.endpoint_url}/runs/{run_id}/models/{model_id}/version'
-        await self.send_patch_request(uri, headers, params)
+        self.patches.update(uri, headers, params)
 
     async def add_version(self, run_id, model_id, token, version):
         body = {'version': str(version)}
@@ -236,5 +676,5 @@ class Sender:
         artifact['tags'][key] = value
         body = {'tags': artifact['tags']}
         uri = f'{self.endpoint_url}/artifacts/{artifact["id"]}'
-        await self.send_patch_request(uri, headers, body)
+        await self.send_spooled("PATCH", uri, headers, body)
         return artifact["id"], path, artifact['tags']
@@ -0,0 +1,245 @@
+import logging
+import os
+import shutil
+import struct
+import zlib
+
+import psutil
+
+from optscale_arcee import serializer
+
+LOG = logging.getLogger(__name__)
+
+# record header: payload length and crc32 of payload
+_HEADER = struct.Struct("<II")
+_SEGMENT_SUFFIX = ".seg"
+_CURSOR = "cursor"
+# spool files are readable by the owner only
+_DIR_MODE = 0o700
+_FILE_MODE = 0o600
+
+
+def _open_private(path, flags, mode):
+    return os.fdopen(os.open(path, flags, _FILE_MODE), mode)
+
+
+class Spool:
+    """
+    Append-only on-disk queue of outgoing requests.
+    Records are appended to segment files, every record is prefixed with
+    its length and crc32 checksum. The read position is kept in a cursor
+    file, so pending records survive process restarts. Consumed segments
+    are removed, the oldest segments are dropped when the spool exceeds
+    max_size bytes.
+    A spool directory must be used by a single process only
+    """
+    segment_size = 4 * 1024 * 1024
+    max_size = 256 * 1024 * 1024
+
+    def __init__(self, path, segment_size=None, max_size=None):
+        self.path = path
+        if segment_size is not None:
+            self.segment_size = segment_size
+        if max_size is not None:
+            self.max_size = max_size
+        os.makedirs(path, mode=_DIR_MODE, exist_ok=True)
+        self._segments = sorted(
+            int(name[:-len(_SEGMENT_SUFFIX)]) for name in os.listdir(path)
+            if name.endswith(_SEGMENT_SUFFIX)
+        )
+        self._size = sum(
+            os.path.getsize(self._segment_path(seq)) for seq in self._segments
+        )
+        self._read_seq, self._read_offset = self._load_cursor()
+        self._reader = None
+        self._head = None
+        # segments of previous processes are never appended to
+        self._writer = None
+        self._write_seq = None
+        self.compact()
+
+    @classmethod
+    def create(cls, root, **kwargs):
+        """
+        Opens spool of the current process in root directory and takes
+        over spools left by processes which are not running anymore
+        :param root: spool root directory
+        :return: (Spool) spool
+        """
+        os.makedirs(root, mode=_DIR_MODE, exist_ok=True)
+        pid = os.getpid()
+        spool = cls(os.path.join(root, str(pid)), **kwargs)
+        for name in sorted(os.listdir(root)):
+            if not name.isdigit() or int(name) == pid:
+                continue
+            if not psutil.pid_exists(int(name)):
+                spool.adopt(os.path.join(root, name))
+        return spool
+
+    def _segment_path(self, seq):
+        return os.path.join(self.path, "%020d%s" % (seq, _SEGMENT_SUFFIX))
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.path, _CURSOR)) as f:
+                seq, offset = f.read().split()
+                return int(seq), int(offset)
+        except (OSError, ValueError):
+            return (self._segments[0] if self._segments else 0), 0
+
+    def _save_cursor(self):
+        cursor_path = os.path.join(self.path, _CURSOR)
+        tmp_path = cursor_path + ".tmp"
+        with _open_private(
+                tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, "w") as f:
+            f.write("%s %s" % (self._read_seq, self._read_offset))
+        os.replace(tmp_path, cursor_path)
+
+    def _roll(self):
+        if self._writer is not None:
+            self._writer.close()
+        # sequence numbers never go back, so the cursor can't point past
+        # unread segments
+        self._write_seq = max(self._segments + [self._read_seq]) + 1
+        self._segments.append(self._write_seq)
+        self._writer = _open_private(
+            self._segment_path(self._write_seq),
+            os.O_WRONLY | os.O_CREAT | os.O_APPEND, "ab")
+
+    def append(self, record):
+        """
+        Writes record to the end of the spool
+        :param record: record supported by serializer.dumps
+        """
+        payload = serializer.dumps(record)
+        if self._writer is None or self._writer.tell() >= self.segment_size:
+            self._roll()
+        self._writer.write(
+            _HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._writer.flush()
+        self._size += _HEADER.size + len(payload)
+        if self._size > self.max_size:
+            self.compact()
+
+    def _close_reader(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def _next_segment(self):
+        """
+        Moves the cursor to the next segment, the current one is removed
+        """
+        self._close_reader()
+        self._remove_segment(self._read_seq)
+        following = [seq for seq in self._segments if seq > self._read_seq]
+        if not following:
+            return False
+        self._read_seq, self._read_offset = following[0], 0
+        self._save_cursor()
+        return True
+
+    def _remove_segment(self, seq):
+        if seq == self._write_seq:
+            # current segment is read completely, start a new one
+            self._writer.close()
+            self._writer = None
+            self._write_seq = None
+        if seq in self._segments:
+            self._segments.remove(seq)
+            path = self._segment_path(seq)
+            self._size -= os.path.getsize(path)
+            os.remove(path)
+
+    def peek(self):
+        """
+        Returns the first pending record without removing it
+        :return: record or None if the spool is empty
+        """
+        if self._head is not None:
+            return self._head[0]
+        while self._segments:
+            if self._read_seq not in self._segments:
+                self._read_seq, self._read_offset = self._segments[0], 0
+            if self._reader is None:
+                self._reader = open(self._segment_path(self._read_seq), "rb")
+            self._reader.seek(self._read_offset)
+            header = self._reader.read(_HEADER.size)
+            if not header and self._read_seq == self._write_seq:
+                return None
+            if len(header) == _HEADER.size:
+                length, checksum = _HEADER.unpack(header)
+                payload = self._reader.read(length)
+                valid = len(payload) == length
+                if valid and zlib.crc32(payload) == checksum:
+                    self._head = (
+                        serializer.loads(payload),
+                        self._read_offset + _HEADER.size + length
+                    )
+                    return self._head[0]
+            if header:
+                # tail of a segment written by a crashed process
+                LOG.warning("Skipping corrupted spool segment %s",
+                            self._segment_path(self._read_seq))
+            if not self._next_segment():
+                return None
+        return None
+
+    def pop(self):
+        """
+        Removes the first pending record returned by peek()
+        """
+        if self._head is None and self.peek() is None:
+            return
+        self._read_offset = self._head[1]
+        self._head = None
+        self._save_cursor()
+
+    def empty(self):
+        return self.peek() is None
+
+    def compact(self):
+        """
+        Removes consumed segments and drops the oldest ones if the spool
+        exceeds max_size
+        """
+        for seq in list(self._segments):
+            if seq < self._read_seq:
+                self._remove_segment(seq)
+        while self._size > self.max_size and len(self._segments) > 1:
+            seq = self._segments[0]
+            LOG.warning("Spool size limit exceeded, dropping segment %s",
+                        self._segment_path(seq))
+            self._head = None
+            self._close_reader()
+            self._remove_segment(seq)
+            self._read_seq, self._read_offset = self._segments[0], 0
+            self._save_cursor()
+
+    def adopt(self, path):
+        """
+        Moves pending records of another spool to this one
+        :param path: spool directory
+        """
+        other = Spool(path)
+        while True:
+            record = other.peek()
+            if record is None:
+                break
+            self.append(record)
+            other.pop()
+        other.close()
+        shutil.rmtree(path, ignore_errors=True)
+
+    def close(self):
+        """
+        Closes spool files, the spool directory is removed if all records
+        were consumed
+        """
+        empty = self.empty()
+        self._close_reader()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if empty:
+            shutil.rmtree(self.path, ignore_errors=True)
@@ -0,0 +1,71 @@
+import json
+import math
+from enum import Enum
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def default(obj):
+    """
+    Converts values json encoders don't support natively
+    """
+    if isinstance(obj, Enum):
+        return obj.value
+    # torch tensors, moved to numpy which orjson encodes natively
+    if hasattr(obj, "detach") and hasattr(obj, "cpu"):
+        obj = obj.detach().cpu()
+        if obj.dim() == 0:
+            return obj.item()
+        return obj.numpy()
+    # numpy scalars and arrays orjson doesn't support (e.g. float16,
+    # non-contiguous), and any numpy value for the stdlib encoder
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError("Object of type %s is not JSON serializable"
+                    % type(obj).__name__)
+
+
+def _finite(obj):
+    """
+    Copy of obj with non-finite floats replaced by None, as orjson encodes
+    them
+    """
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(value) for value in obj]
+    return obj
+
+
+def _finite_default(obj):
+    return _finite(default(obj))
+
+
+def dumps(obj) -> bytes:
+    """
+    Encodes obj to json bytes, orjson is used if installed. NaN and
+    infinity are encoded as null by both encoders
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            obj, default=default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        _finite(obj), default=_finite_default,
+        separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # NaN and Infinity, e.g. in records spooled by older versions,
+            # are not supported by orjson
+            pass
+    return json.loads(data)
@@ -1,7 +1,11 @@
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import partial
 
+LOG = logging.getLogger(__name__)
+
 
 def single(class_):
     instances = {}
@@ -21,3 +25,112 @@ async def run_async(func, *args, loop=None, executor=None, **kwargs):
         executor = ThreadPoolExecutor(max_workers=10)
     pfunc = partial(func, *args, **kwargs)
     return await loop.run_in_executor(executor, pfunc)
+
+
+class LoopThread(threading.Thread):
+    """
+    Daemon thread running a single event loop. Coroutines are submitted
+    from other threads and tracked with concurrent futures
+    """
+
+    def __init__(self, name="arcee-loop"):
+        threading.Thread.__init__(self, name=name, daemon=True)
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+
+    def start(self):
+        threading.Thread.start(self)
+        self._ready.wait()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._ready.set)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+
+    def submit(self, coro) -> Future:
+        """
+        Schedules coroutine on the loop thread
+        :return: (Future) concurrent future with coroutine result
+        """
+        if not self.is_alive():
+            coro.close()
+            raise RuntimeError("Event loop thread is not running")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run_sync(self, coro, timeout=None):
+        """
+        Runs coroutine on the loop thread and waits for its result
+        """
+        if threading.current_thread() is self:
+            coro.close()
+            raise RuntimeError("Can't wait for the loop from its own thread")
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        if self.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.join()
+
+
+class RunQueue:
+    """
+    Runs operations on the loop thread one by one in submission order once
+    the run is created. Operations submitted while the run is being created
+    are queued, they are skipped if the run creation failed
+    """
+
+    def __init__(self, loop_thread):
+        self.loop_thread = loop_thread
+        self.created = None
+        self._tail = None
+
+    @property
+    def pending(self) -> bool:
+        return self.created is None or not self.created.done()
+
+    def start(self, create_coro):
+        """
+        Starts run creation
+        :param create_coro: coroutine creating the run
+        :return: (Future) concurrent future with create_coro result
+        """
+        self.created = self.loop_thread.submit(self._create(create_coro))
+        return self.created
+
+    @staticmethod
+    async def _create(create_coro):
+        try:
+            return await create_coro
+        except Exception as exc:
+            LOG.warning("Failed to create run: %r", exc)
+            raise
+
+    def submit(self, coro_fn, *args):
+        """
+        Schedules coro_fn(*args) after the run is created and operations
+        submitted before are done
+        :return: (Future) concurrent future with coro_fn result, None if
+        the run wasn't created
+        """
+        return self.loop_thread.submit(self._ordered(coro_fn, *args))
+
+    async def _ordered(self, coro_fn, *args):
+        # coroutines submitted from a thread start in submission order
+        prev, done = self._tail, asyncio.get_running_loop().create_future()
+        self._tail = done
+        try:
+            # asyncio.wait doesn't cancel the awaited future on cancellation
+            if prev is not None:
+                await asyncio.wait([prev])
+            created = asyncio.wrap_future(self.created)
+            await asyncio.wait([created])
+            if created.exception() is not None:
+                LOG.debug("Run wasn't created, %s is skipped", coro_fn)
+                return None
+            return await coro_fn(*args)
+        finally:
+            done.set_result(None)
@@ -0,0 +1,55 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from aiounittest import AsyncTestCase
+
+from optscale_arcee import aio
+from optscale_arcee.sender.sender import Sender
+
+
+class TestAio(AsyncTestCase):
+    @patch.object(Sender, "_proc_data", AsyncMock(return_value={}))
+    @patch.object(Sender, "platform_meta", AsyncMock(return_value={}))
+    @patch.object(Sender, "_imports_data", AsyncMock(return_value=[]))
+    async def test_run_on_caller_loop(self):
+        requests = []
+        loops = set()
+
+        async def handler(request):
+            requests.append((request.method, request.path,
+                             await request.json()))
+            return web.json_response({"id": "run"})
+
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", handler)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            run = await aio.init("token", "key", run_name="name",
+                                 endpoint_url=str(server.make_url("")))
+            async with run:
+                loops.update(run.sender._sessions)
+                await aio.tag("k", "v")
+                await aio.hyperparam("lr", 0.1)
+                aio.send({"loss": 0.5})
+                await aio.stage("train")
+            self.assertEqual(aio.info()["_tags"], {"k": "v"})
+        finally:
+            await server.close()
+
+        self.assertEqual(loops, {asyncio.get_running_loop()})
+        self.assertTrue(run.shutdown_flag.is_set())
+        self.assertTrue(run.hb.done())
+        self.assertEqual(run.sender._sessions, {})
+        paths = [(method, path) for method, path, _ in requests]
+        self.assertEqual(paths[0], ("POST", "/tasks/key/run"))
+        # tags and hyperparameters are merged before the stage is created
+        self.assertIn(("PATCH", "/run/run", {
+            "tags": {"k": "v"}, "hyperparameters": {"lr": 0.1}}), requests)
+        self.assertLess(paths.index(("PATCH", "/run/run")),
+                        paths.index(("POST", "/run/run/stages")))
+        self.assertIn(("POST", "/collect"), paths)
+        self.assertEqual(requests[-1],
+                         ("PATCH", "/run/run", {"state": 2, "finish": True}))
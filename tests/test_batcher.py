@@ -0,0 +1,71 @@
+import asyncio
+
+from aiounittest import AsyncTestCase
+
+from optscale_arcee.sender.batcher import MetricsBatcher
+
+
+class TestMetricsBatcher(AsyncTestCase):
+    async def test_flush_on_size(self):
+        batches = list()
+
+        async def flush(points):
+            batches.append(points)
+
+        batcher = MetricsBatcher(flush, max_size=3, max_age=60)
+        await batcher.start()
+        for i in range(7):
+            batcher.put({"data": {"i": i}})
+        await asyncio.sleep(0.01)
+        # queued points are drained in batches of max_size
+        self.assertEqual([len(b) for b in batches], [3, 3, 1])
+        self.assertEqual(len(batcher), 0)
+        batcher.put({"data": {"i": 7}})
+        await batcher.stop()
+        self.assertEqual([len(b) for b in batches], [3, 3, 1, 1])
+        self.assertEqual([p["data"]["i"] for b in batches for p in b],
+                         list(range(8)))
+
+    async def test_flush_on_age(self):
+        batches = list()
+
+        async def flush(points):
+            batches.append(points)
+
+        batcher = MetricsBatcher(flush, max_size=100, max_age=0.05)
+        await batcher.start()
+        batcher.put({"data": {"loss": 1}})
+        await asyncio.sleep(0.2)
+        self.assertEqual(len(batches), 1)
+        await batcher.stop()
+        self.assertEqual(len(batches), 1)
+
+    async def test_failed_flush_does_not_stop_batcher(self):
+        batches = list()
+
+        async def flush(points):
+            batches.append(points)
+            if len(batches) == 1:
+                raise ConnectionError("unreachable")
+
+        batcher = MetricsBatcher(flush, max_size=1, max_age=60)
+        await batcher.start()
+        batcher.put({"data": {"loss": 1}})
+        await asyncio.sleep(0.01)
+        batcher.put({"data": {"loss": 2}})
+        await batcher.stop()
+        self.assertEqual(len(batches), 2)
+
+    async def test_closed_batcher_drops_points(self):
+        async def flush(points):
+            self.fail("points are sent")
+
+        # the run wasn't created, the batcher is never started
+        batcher = MetricsBatcher(flush)
+        batcher.put({"data": {"loss": 1}})
+        batcher.close()
+        self.assertEqual(len(batcher), 0)
+        for i in range(1000):
+            batcher.put({"data": {"i": i}})
+        self.assertEqual(len(batcher), 0)
+        await batcher.stop()
@@ -0,0 +1,137 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from optscale_arcee.collectors.cgroup import Cgroup
+from optscale_arcee.collectors.hardware import Collector
+
+GB = 1024 ** 3
+
+
+class TestCgroup(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = os.path.join(tmp.name, "cgroup")
+        self.proc = os.path.join(tmp.name, "proc")
+
+    def write(self, files):
+        for name, content in files.items():
+            path = os.path.join(self.root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(content)
+
+    def write_proc_cgroup(self, content):
+        os.makedirs(os.path.join(self.proc, "self"))
+        with open(os.path.join(self.proc, "self", "cgroup"), "w") as f:
+            f.write(content)
+
+    def test_v2(self):
+        self.write_proc_cgroup("0::/kubepods/pod1\n")
+        self.write({
+            "cgroup.controllers": "cpu memory\n",
+            "cpu.max": "max 100000\n",
+            "memory.max": "max\n",
+            # the parent limit is lower than the pod one
+            "kubepods/memory.max": "%s\n" % (8 * GB),
+            "kubepods/pod1/cpu.max": "400000 100000\n",
+            "kubepods/pod1/memory.max": "%s\n" % (16 * GB),
+            "kubepods/pod1/memory.current": "%s\n" % (3 * GB),
+            "kubepods/pod1/memory.stat": "anon 1\ninactive_file %s\n" % GB,
+            "kubepods/pod1/cpu.stat": "usage_usec 1000000\nnr_periods 10\n"
+                                      "nr_throttled 1\nthrottled_usec 5000\n",
+        })
+        cgroup = Cgroup(self.root, self.proc)
+        self.assertEqual(cgroup.version, 2)
+        self.assertEqual(cgroup.cpu_limit(), 4.0)
+        self.assertEqual(cgroup.memory_limit(), 8 * GB)
+        self.assertEqual(cgroup.memory_used(), 2 * GB)
+        with patch("time.monotonic", side_effect=[10, 12]):
+            stats = cgroup.sample()
+            self.assertNotIn("cpu_percent", stats)
+            self.write({
+                "kubepods/pod1/cpu.stat": "usage_usec 5000000\n"
+                                          "nr_periods 30\nnr_throttled 6\n"
+                                          "throttled_usec 505000\n",
+            })
+            stats = cgroup.sample()
+        self.assertEqual(stats, {
+            "version": 2,
+            "cpu_limit": 4.0,
+            "memory_limit": 8 * GB,
+            "memory_used": 2 * GB,
+            "memory_percent": 25.0,
+            # 4 cpu seconds in 2 seconds of 4 cpus
+            "cpu_percent": 50.0,
+            "throttled_seconds": 0.5,
+            "throttled_percent": 25.0,
+        })
+
+    def test_v2_container_root(self):
+        # a cgroup namespace hides the path of the container cgroup
+        self.write_proc_cgroup("0::/kubepods/pod1\n")
+        self.write({
+            "cgroup.controllers": "cpu memory\n",
+            "cpu.max": "150000 100000\n",
+            "memory.max": "%s\n" % GB,
+        })
+        cgroup = Cgroup(self.root, self.proc)
+        self.assertEqual(cgroup.cpu_limit(), 1.5)
+        self.assertEqual(cgroup.memory_limit(), GB)
+        self.assertIsNone(cgroup.memory_used())
+
+    def test_v1(self):
+        self.write_proc_cgroup(
+            "4:memory:/docker/abc\n3:cpu,cpuacct:/docker/abc\n")
+        self.write({
+            "cpu,cpuacct/docker/abc/cpu.cfs_quota_us": "200000\n",
+            "cpu,cpuacct/docker/abc/cpu.cfs_period_us": "100000\n",
+            "cpu,cpuacct/docker/abc/cpu.stat":
+                "nr_periods 4\nnr_throttled 2\nthrottled_time 250000000\n",
+            "cpu,cpuacct/docker/abc/cpuacct.usage": "3000000000\n",
+            "cpu,cpuacct/cpu.cfs_quota_us": "-1\n",
+            "memory/memory.limit_in_bytes": "9223372036854771712\n",
+            "memory/docker/abc/memory.limit_in_bytes": "%s\n" % (4 * GB),
+            "memory/docker/abc/memory.usage_in_bytes": "%s\n" % GB,
+            "memory/docker/abc/memory.stat": "total_inactive_file 0\n",
+        })
+        cgroup = Cgroup(self.root, self.proc)
+        self.assertEqual(cgroup.version, 1)
+        self.assertEqual(cgroup.cpu_limit(), 2.0)
+        self.assertEqual(cgroup.memory_limit(), 4 * GB)
+        self.assertEqual(cgroup.memory_used(), GB)
+        self.assertEqual(cgroup.cpu_stat(), {
+            "usage": 3.0, "throttled": 0.25, "periods": 4,
+            "throttled_periods": 2})
+
+    def test_unlimited(self):
+        self.write_proc_cgroup("0::/\n")
+        self.write({
+            "cgroup.controllers": "cpu memory\n",
+            "cpu.max": "max 100000\n",
+            "memory.max": "max\n",
+        })
+        cgroup = Cgroup(self.root, self.proc)
+        self.assertIsNone(cgroup.cpu_limit())
+        self.assertIsNone(cgroup.memory_limit())
+
+    def test_stats_use_limits(self):
+        self.write_proc_cgroup("0::/\n")
+        self.write({
+            "cgroup.controllers": "cpu memory\n",
+            "cpu.max": "50000 100000\n",
+            "memory.max": "%s\n" % (64 * 1024 ** 2),
+            "memory.current": "%s\n" % (32 * 1024 ** 2),
+            "cpu.stat": "usage_usec 0\n",
+        })
+        with patch.object(Collector, "cgroup", Cgroup(self.root, self.proc)):
+            stats = Collector._collect_stats()
+        ps_stats = stats["ps_stats"]
+        self.assertEqual(ps_stats["cpu_count"], 1)
+        self.assertEqual(ps_stats["used_ram_percent"], 50.0)
+        self.assertEqual(ps_stats["used_ram_mb"], 32)
+        self.assertEqual(ps_stats["cgroup"]["cpu_limit"], 0.5)
+        # the process memory is compared to the limit
+        self.assertGreater(float(stats["proc"]["mem"]["rss"]["p"]), 0.1)
@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+import unittest
+
+from optscale_arcee.collectors.console import CaptureBuffer, WritesCollector
+
+
+class TestCaptureBuffer(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.spill_dir = tmp.name
+        self.buffer = CaptureBuffer(memory_limit=16, max_size=40,
+                                    head_size=10, spill_dir=self.spill_dir)
+        self.addCleanup(self.buffer.close)
+
+    def test_spill(self):
+        self.buffer.write("0123456789")
+        self.assertFalse(self.buffer.spilled)
+        self.buffer.write("abcdefghij")
+        self.assertTrue(self.buffer.spilled)
+        self.assertEqual(self.buffer.getvalue(), "0123456789abcdefghij")
+
+    def test_head_and_tail_are_kept(self):
+        written = ""
+        for i in range(50):
+            line = "line %s\n" % i
+            self.buffer.write(line)
+            written += line
+            expected = written
+            if len(written) > 40:
+                expected = "%s\n... %s bytes skipped ...\n%s" % (
+                    written[:10], len(written) - 40, written[-30:])
+            self.assertEqual(self.buffer.getvalue(), expected)
+        # a write bigger than the tail keeps its end only
+        self.buffer.write("x" * 100 + "end")
+        self.assertTrue(self.buffer.getvalue().endswith("x" * 27 + "end"))
+        self.assertEqual(self.buffer.size, len(written) + 103)
+
+    def test_memory_buffer_is_not_copied_to_file(self):
+        buffer = CaptureBuffer(spill_dir=self.spill_dir)
+        self.addCleanup(buffer.close)
+        buffer.write("text\n" * 1000)
+        self.assertFalse(buffer.spilled)
+        self.assertEqual(os.listdir(self.spill_dir), [])
+
+    def test_json_chunks(self):
+        collector = WritesCollector(None)
+        collector.stream = self.buffer
+        self.buffer.chunk_size = 3
+        text = "файл \"a\"\n\t"
+        collector.stream.write(text)
+        self.assertEqual(
+            json.loads(b"".join(collector.json_chunks())), text)
@@ -0,0 +1,109 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from optscale_arcee.collectors.git import Collector, Repository
+
+
+@unittest.skipIf(shutil.which("git") is None, "git is not installed")
+class TestGitCollector(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+        self.repo = os.path.join(self.root, "repo")
+        os.makedirs(os.path.join(self.repo, "src"))
+        self.git("init", "-q", "-b", "main")
+        self.git("remote", "add", "origin", "git@example.com:org/repo.git")
+        self.write("src/train.py", "print(1)\n")
+        self.write("README.md", "readme\n")
+        self.git("add", ".")
+        self.git("commit", "-q", "-m", "initial")
+
+    def git(self, *args, cwd=None):
+        return subprocess.check_output(
+            ["git", "-c", "user.name=test", "-c", "user.email=test@test",
+             "-c", "protocol.file.allow=always"] + list(args),
+            cwd=cwd or self.repo, stderr=subprocess.DEVNULL
+        ).decode().strip()
+
+    def write(self, path, content, repo=None):
+        with open(os.path.join(repo or self.repo, path), "w") as f:
+            f.write(content)
+
+    def test_collect(self):
+        info = Collector._collect(os.path.join(self.repo, "src"))
+        self.assertEqual(info, {
+            "remote": "git@example.com:org/repo.git",
+            "branch": "main",
+            "commit_id": self.git("rev-parse", "HEAD"),
+            "status": "clean",
+        })
+
+    def test_packed_refs_and_detached_head(self):
+        commit_id = self.git("rev-parse", "HEAD")
+        self.git("pack-refs", "--all")
+        self.assertFalse(os.path.exists(
+            os.path.join(self.repo, ".git", "refs", "heads", "main")))
+        self.assertEqual(Collector._collect(self.repo)["commit_id"],
+                         commit_id)
+        self.git("checkout", "-q", "--detach")
+        info = Collector._collect(self.repo)
+        self.assertEqual((info["branch"], info["commit_id"]), ("", commit_id))
+
+    def test_status(self):
+        path = os.path.join(self.repo, "README.md")
+        # stats changed, content didn't
+        later = time.time() + 10
+        os.utime(path, (later, later))
+        self.assertEqual(Collector._collect(self.repo)["status"], "clean")
+        self.write("README.md", "changed\n")
+        self.assertEqual(Collector._collect(self.repo)["status"], "dirty")
+        os.remove(path)
+        self.assertEqual(Collector._collect(self.repo)["status"], "dirty")
+
+    def test_status_of_many_touched_files(self):
+        later = time.time() + 10
+        for path in ("README.md", "src/train.py"):
+            os.utime(os.path.join(self.repo, path), (later, later))
+        with patch.object(Collector, "max_status_paths", 1):
+            self.assertEqual(Collector._collect(self.repo)["status"],
+                             "clean")
+            self.write("src/train.py", "print(2)\n")
+            self.assertEqual(Collector._collect(self.repo)["status"],
+                             "dirty")
+
+    def test_status_timeout(self):
+        with patch.object(Collector, "status_timeout", 0):
+            status = Collector._get_status(Repository.find(self.repo))
+        self.assertEqual(status, "unknown")
+
+    def test_worktree(self):
+        worktree = os.path.join(self.root, "worktree")
+        self.git("worktree", "add", "-q", "-b", "feature", worktree)
+        self.write("new.py", "", repo=worktree)
+        self.git("add", "new.py", cwd=worktree)
+        self.git("commit", "-q", "-m", "feature", cwd=worktree)
+        info = Collector._collect(worktree)
+        self.assertEqual(info["branch"], "feature")
+        self.assertEqual(info["remote"], "git@example.com:org/repo.git")
+        self.assertEqual(info["commit_id"],
+                         self.git("rev-parse", "HEAD", cwd=worktree))
+        self.assertEqual(info["status"], "clean")
+
+    def test_submodule(self):
+        self.git("submodule", "add", "-q", self.repo, "sub")
+        submodule = os.path.join(self.repo, "sub")
+        self.assertTrue(os.path.isfile(os.path.join(submodule, ".git")))
+        info = Collector._collect(submodule)
+        self.assertEqual(info["remote"], self.repo)
+        self.assertEqual(info["commit_id"],
+                         self.git("rev-parse", "HEAD", cwd=submodule))
+        self.assertEqual(info["status"], "clean")
+
+    def test_not_a_repository(self):
+        self.assertIsNone(Collector._collect(self.root))
@@ -0,0 +1,233 @@
+import ctypes
+import math
+import os
+import tempfile
+import time
+import unittest
+import uuid
+from unittest.mock import patch
+
+from optscale_arcee.collectors.gpu import (
+    NullBackend, NvmlBackend, NvmlError, SmiBackend, StreamingSmiBackend,
+    create_backend)
+from optscale_arcee import serializer
+from optscale_arcee.collectors.hardware import Collector
+from optscale_arcee.libs.GPUtil.GPUtil import GPU
+
+NOT_SUPPORTED = 3
+
+
+class FakeNvml:
+    """
+    NVML library stand-in, devices are (uuid, load %, used MB, total MB,
+    temperature, power mW)
+    """
+
+    def __init__(self, devices):
+        self.devices = devices
+        self.calls = list()
+        self.initialized = False
+
+    def _device(self, handle):
+        return self.devices[ctypes.cast(handle, ctypes.c_void_p).value - 1]
+
+    def nvmlInit_v2(self):
+        self.initialized = True
+        return 0
+
+    def nvmlShutdown(self):
+        self.initialized = False
+        return 0
+
+    def nvmlDeviceGetCount_v2(self, count):
+        count._obj.value = len(self.devices)
+        return 0
+
+    def nvmlDeviceGetHandleByIndex_v2(self, index, handle):
+        self.calls.append("handle")
+        handle._obj.value = index + 1
+        return 0
+
+    def nvmlDeviceGetUUID(self, handle, buffer, size):
+        buffer.value = self._device(handle)[0].encode()
+        return 0
+
+    def nvmlDeviceGetUtilizationRates(self, handle, utilization):
+        utilization._obj.gpu = self._device(handle)[1]
+        return 0
+
+    def nvmlDeviceGetMemoryInfo(self, handle, memory):
+        _, _, used, total, _, _ = self._device(handle)
+        memory._obj.total = total * 1024 * 1024
+        memory._obj.used = used * 1024 * 1024
+        memory._obj.free = (total - used) * 1024 * 1024
+        return 0
+
+    def nvmlDeviceGetTemperature(self, handle, sensor, value):
+        temperature = self._device(handle)[4]
+        if temperature is None:
+            return NOT_SUPPORTED
+        value._obj.value = temperature
+        return 0
+
+    def nvmlDeviceGetPowerUsage(self, handle, value):
+        power = self._device(handle)[5]
+        if power is None:
+            return NOT_SUPPORTED
+        value._obj.value = power
+        return 0
+
+
+class TestNvmlBackend(unittest.TestCase):
+    def setUp(self):
+        self.lib = FakeNvml([
+            ("GPU-1", 90, 1000, 16000, 70, 250000),
+            ("GPU-2", 10, 3000, 16000, None, None),
+        ])
+
+    def test_devices(self):
+        backend = NvmlBackend(self.lib)
+        for _ in range(3):
+            gpus = backend.devices()
+        # handles are obtained once
+        self.assertEqual(self.lib.calls, ["handle", "handle"])
+        self.assertEqual(
+            [(g.index, g.uuid, g.load, g.memory_used, g.memory_free,
+              g.temperature, g.power) for g in gpus],
+            [(0, "GPU-1", 0.9, 1000, 15000, 70, 250),
+             (1, "GPU-2", 0.1, 3000, 13000, None, None)])
+        backend.close()
+        self.assertFalse(self.lib.initialized)
+        self.assertEqual(backend.devices(), [])
+
+    def test_gpu_stats(self):
+        with patch.object(Collector, "_gpu_backend", NvmlBackend(self.lib)):
+            stats = Collector._gpu_stats()
+        self.assertEqual(stats, {
+            "avg_gpu_memory_free": 14000,
+            "avg_gpu_memory_total": 16000,
+            "avg_gpu_memory_used": 2000,
+            "avg_gpu_load": 50,
+            # devices which don't report a value are skipped
+            "avg_gpu_temperature": 70,
+            "avg_gpu_power": 250,
+            "gpus": {
+                "index": [0, 1],
+                "uuid": ["GPU-1", "GPU-2"],
+                "load": [90, 10],
+                "memory_used": [1000, 3000],
+                "memory_total": [16000, 16000],
+                "memory_free": [15000, 13000],
+                "temperature": [70, None],
+                "power": [250, None],
+            },
+        })
+
+    def test_gpu_stats_size(self):
+        lib = FakeNvml([
+            ("GPU-%s" % uuid.uuid4(), 99, 81001, 81920, 85, 699999)
+            for _ in range(16)
+        ])
+        with patch.object(Collector, "_gpu_backend", NvmlBackend(lib)):
+            stats = Collector._gpu_stats()
+        self.assertEqual(len(stats["gpus"]["load"]), 16)
+        self.assertLess(len(serializer.dumps(stats)), 2048)
+
+    def test_init_failure(self):
+        self.lib.nvmlDeviceGetCount_v2 = lambda count: 999
+        with self.assertRaises(NvmlError):
+            NvmlBackend(self.lib)
+        self.assertFalse(self.lib.initialized)
+
+    def test_nvidia_smi_fallback(self):
+        gpu = GPU(0, "GPU-1", 0.5, 100.0, 25.0, 75.0, "550", "A100", "",
+                  "Disabled", "Disabled", 40.0)
+        with patch("ctypes.CDLL", side_effect=OSError("not found")), \
+                patch("shutil.which", return_value=None), \
+                patch("optscale_arcee.collectors.gpu._windows_nvidia_smi",
+                      return_value="C:\\nvidia-smi.exe"), \
+                patch("optscale_arcee.libs.GPUtil.GPUtil.getGPUs",
+                      return_value=[gpu]):
+            backend = create_backend()
+            self.assertIsInstance(backend, SmiBackend)
+            device, = backend.devices()
+        self.assertEqual((device.uuid, device.load, device.memory_used,
+                          device.temperature, device.power),
+                         ("GPU-1", 0.5, 25.0, 40.0, None))
+
+    def test_no_gpus(self):
+        with patch("ctypes.CDLL", side_effect=OSError("not found")), \
+                patch("shutil.which", return_value=None), \
+                patch("subprocess.Popen") as popen:
+            backend = create_backend()
+            for _ in range(5):
+                self.assertEqual(backend.devices(), [])
+        self.assertIsInstance(backend, NullBackend)
+        popen.assert_not_called()
+
+
+FAKE_NVIDIA_SMI = """#!/bin/sh
+echo "$@" > "{dir}/args"
+echo started >> "{dir}/starts"
+echo "0, GPU-1, 30, 16000, 4000, 12000, 60, 120.50"
+echo "1, GPU-2, [N/A], 16000, 0, 16000, [N/A], [Not Supported]"
+{tail}
+"""
+
+
+@unittest.skipIf(os.name == "nt", "shell script is used as nvidia-smi")
+class TestStreamingSmiBackend(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.nvidia_smi = os.path.join(self.dir, "nvidia-smi")
+
+    def _fake(self, tail):
+        with open(self.nvidia_smi, "w") as f:
+            f.write(FAKE_NVIDIA_SMI.format(dir=self.dir, tail=tail))
+        os.chmod(self.nvidia_smi, 0o755)
+
+    def _wait(self, predicate, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() > deadline:
+                self.fail("timed out")
+            time.sleep(0.01)
+
+    def test_stream(self):
+        self._fake("exec sleep 60")
+        path = self.dir + os.pathsep + os.environ.get("PATH", "")
+        with patch.dict(os.environ, {"PATH": path}):
+            backend = create_backend(use_nvml=False)
+        self.assertIsInstance(backend, StreamingSmiBackend)
+        try:
+            self._wait(lambda: len(backend.devices()) == 2)
+            first, second = backend.devices()
+            process = backend._process
+        finally:
+            backend.close()
+        self.assertIsNotNone(process.poll())
+        self.assertEqual((first.uuid, first.load, first.memory_used,
+                          first.temperature, first.power),
+                         ("GPU-1", 0.3, 4000, 60, 120.5))
+        self.assertTrue(math.isnan(second.load))
+        self.assertEqual((second.temperature, second.power), (None, None))
+        with open(os.path.join(self.dir, "args")) as f:
+            self.assertIn("-lms 500", f.read())
+
+    def test_restart(self):
+        self._fake("exit 1")
+        with patch.object(StreamingSmiBackend, "restart_delay", 0.01):
+            backend = StreamingSmiBackend(self.nvidia_smi)
+            try:
+                self._wait(lambda: backend.restarts >= 2)
+            finally:
+                backend.close()
+        with open(os.path.join(self.dir, "starts")) as f:
+            self.assertGreaterEqual(len(f.readlines()), 3)
+
+    def test_missing_nvidia_smi(self):
+        backend = StreamingSmiBackend(self.nvidia_smi)
+        backend.close()
+        self.assertEqual(backend.devices(), [])
@@ -0,0 +1,111 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from collections import namedtuple
+from unittest.mock import MagicMock, patch
+
+from optscale_arcee.collectors.hardware import (
+    Collector, CpuSampler, PsutilReader)
+from optscale_arcee.collectors.procfs import ProcfsReader
+
+cputimes = namedtuple("scputimes", ["user", "system", "idle", "iowait"])
+proctimes = namedtuple("pcputimes", ["user", "system"])
+
+
+class TestCpuSampler(unittest.TestCase):
+    def test_usage_is_computed_from_deltas(self):
+        sampler = CpuSampler(PsutilReader())
+        process = MagicMock(pid=None)
+        process.create_time.return_value = time.time() - 10
+        process.cpu_times.side_effect = [proctimes(4, 1), proctimes(5, 1.5)]
+        cpu_times = [
+            [cputimes(10, 10, 70, 10), cputimes(0, 0, 100, 0)],
+            [cputimes(15, 15, 80, 10), cputimes(20, 0, 100, 0)],
+        ]
+        with patch("psutil.Process", return_value=process), \
+                patch("os.getpid", return_value=None), \
+                patch("psutil.cpu_times", side_effect=cpu_times), \
+                patch("time.monotonic", side_effect=[100, 103]):
+            # the first sample is the average since boot and process start
+            self.assertEqual(sampler.sample(), ([20.0, 0.0], 50.0))
+            self.assertEqual(sampler.sample(), ([50.0, 100.0], 50.0))
+
+    def test_process_usage_is_not_capped(self):
+        reader = MagicMock(cpu_count=8)
+        reader.cpu_times.return_value = [(0, 100)] * 8
+        reader.process_age.return_value = 1
+        # 4 cpus are used for 1 second, then for 2 seconds
+        reader.process_cpu_time.side_effect = [4, 12]
+        sampler = CpuSampler(reader)
+        with patch("time.monotonic", side_effect=[100, 102]):
+            self.assertEqual(sampler.sample()[1], 400.0)
+            self.assertEqual(sampler.sample()[1], 400.0)
+
+    def test_stats_are_not_blocking(self):
+        started_at = time.monotonic()
+        for _ in range(3):
+            stats = Collector._collect_stats()
+        self.assertLess(time.monotonic() - started_at, 0.5)
+        self.assertEqual(len(stats["ps_stats"]["cpu_percent_percpu"]),
+                         stats["ps_stats"]["cpu_count"])
+        self.assertGreaterEqual(stats["proc"]["cpu"], 0)
+
+
+class TestProcfsReader(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+        os.makedirs(os.path.join(self.root, "42"))
+        files = {
+            "stat": "cpu  30 0 10 50 10 0 0 0 0 0\n"
+                    "cpu0 20 0 5 20 5 0 0 0 0 0\n"
+                    "cpu1 10 0 5 30 5 0 0 0 5 0\n"
+                    "intr 1 2 3\n",
+            "meminfo": "MemTotal:  1000 kB\nMemFree:  100 kB\n"
+                       "MemAvailable:  250 kB\nSwapTotal:  500 kB\n",
+            "loadavg": "0.50 0.25 0.10 1/100 42\n",
+            "uptime": "1000.00 900.00\n",
+            "42/stat": "42 (python (train) x) S 1 42 42 0 -1 0 0 0 0 0 "
+                       "300 200 0 0 20 0 1 0 50000 0 0\n",
+            "42/statm": "100 20 5 1 0 10 0\n",
+        }
+        for name, content in files.items():
+            with open(os.path.join(self.root, name), "w") as f:
+                f.write(content)
+        self.reader = ProcfsReader(self.root, pid=42)
+        self.addCleanup(self.reader.close)
+
+    def test_read(self):
+        ticks = os.sysconf("SC_CLK_TCK")
+        page = os.sysconf("SC_PAGE_SIZE")
+        self.assertEqual(self.reader.cpu_times(), [
+            (25 / ticks, 50 / ticks), (15 / ticks, 50 / ticks)])
+        self.assertEqual(self.reader.process_cpu_time(), 500 / ticks)
+        self.assertEqual(self.reader.process_age(), 1000 - 50000 / ticks)
+        self.assertEqual(self.reader.process_memory(), (100 * page, 20 * page))
+        self.assertEqual(self.reader.memory(),
+                         (1024000, 768000, 75.0, 512000))
+        self.assertEqual(self.reader.loadavg(), (0.5, 0.25, 0.1))
+
+    def test_files_are_reread(self):
+        self.assertEqual(self.reader.loadavg(), (0.5, 0.25, 0.1))
+        with open(os.path.join(self.root, "loadavg"), "w") as f:
+            f.write("1.5 1.25 1.0 1/100 42\n")
+        self.assertEqual(self.reader.loadavg(), (1.5, 1.25, 1.0))
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "Linux only")
+    def test_matches_psutil(self):
+        reader, psutil_reader = ProcfsReader(), PsutilReader()
+        self.addCleanup(reader.close)
+        self.assertEqual(len(reader.cpu_times()),
+                         len(psutil_reader.cpu_times()))
+        self.assertAlmostEqual(reader.process_cpu_time(),
+                               psutil_reader.process_cpu_time(), delta=0.5)
+        self.assertAlmostEqual(reader.process_age(),
+                               psutil_reader.process_age(), delta=1)
+        self.assertEqual(reader.memory()[0], psutil_reader.memory()[0])
+        self.assertEqual(reader.process_memory()[0],
+                         psutil_reader.process_memory()[0])
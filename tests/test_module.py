@@ -0,0 +1,69 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from optscale_arcee.collectors.module import Collector
+
+
+class TestModuleCollector(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        cache_patch = patch.object(Collector, "cache_dir", self.tmp.name)
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+
+    def _script(self, source):
+        path = os.path.join(self.tmp.name, "train.py")
+        with open(path, "w") as f:
+            f.write(source)
+        return path
+
+    def test_main_script_imports(self):
+        script = self._script(
+            "import os, torch.nn\n"
+            "from sklearn.linear_model import Ridge\n"
+            "from . import local\n"
+            "def train():\n"
+            "    import tensorflow as tf\n")
+        self.assertEqual(Collector._main_imports(script),
+                         {"os", "torch", "sklearn", "tensorflow"})
+        self.assertEqual(Collector._main_imports(self._script("import (")),
+                         set())
+
+    @patch.object(Collector, "_loaded_modules", return_value={"numpy"})
+    def test_framework_versions(self, _):
+        script = self._script("import tensorflow\nimport pandas\n")
+        with patch.object(Collector, "_distributions", return_value={
+                "numpy": "1.26.4", "tensorflow": "2.15.0"}):
+            inventory = Collector._collect(script)
+        self.assertEqual(inventory, {
+            "tf": "2.15.0", "numpy": "1.26.4", "pandas": None})
+        self.assertEqual(list(inventory), ["tf", "numpy", "pandas"])
+
+    @patch.object(Collector, "_loaded_modules", return_value={"numpy"})
+    def test_imports_do_not_read_distributions(self, _):
+        with patch.object(Collector, "_versions") as versions:
+            imports = asyncio.run(Collector.get_imports(
+                self._script("import torch\n")))
+        self.assertEqual(imports, ["torch", "numpy"])
+        versions.assert_not_called()
+
+    def test_versions_are_cached(self):
+        with patch.object(Collector, "_distributions",
+                          return_value={"numpy": "1.26.4"}) as dists:
+            self.assertEqual(Collector._versions(), {"numpy": "1.26.4"})
+            self.assertEqual(Collector._versions(), {"numpy": "1.26.4"})
+            self.assertEqual(dists.call_count, 1)
+            # installing packages changes site-packages mtime
+            with patch.object(sys, "path", sys.path + [self.tmp.name]):
+                Collector._versions()
+            self.assertEqual(dists.call_count, 2)
+
+    def test_installed_distributions(self):
+        versions = Collector._distributions()
+        self.assertIn("aiohttp", versions)
+        self.assertIn("psutil", versions)
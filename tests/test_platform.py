@@ -1,3 +1,9 @@
+import asyncio
+import json
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 from aiounittest import AsyncTestCase
 from unittest.mock import patch
 
@@ -155,3 +161,118 @@ class TestGcpCollector(AsyncTestCase):
         self.assertTrue(platform_meta.platform_type, PlatformType.gcp)
         self.assertTrue(platform_meta.instance_lc, InstanceLifeCycle.OnDemand)
         self.assertTrue(platform_meta.to_dict())
+
+
+class TestImdsCollectors(AsyncTestCase):
+    def setUp(self):
+        AwsCollector._token = None
+        AwsCollector._token_expires_at = 0
+        self.tokens = list()
+
+    async def _imds_server(self, fields, delays=None, delay=0.1,
+                           imds_v2=False):
+        delays = delays or {}
+
+        async def handler(request):
+            field = request.match_info["field"]
+            if field not in fields:
+                raise web.HTTPNotFound()
+            token = request.headers.get("X-aws-ec2-metadata-token")
+            if imds_v2 and (not self.tokens or token != self.tokens[-1]):
+                raise web.HTTPUnauthorized()
+            await asyncio.sleep(delays.get(field, delay))
+            return web.Response(text=fields[field])
+
+        async def token_handler(request):
+            if not imds_v2:
+                raise web.HTTPForbidden()
+            self.tokens.append("token-%s" % len(self.tokens))
+            return web.Response(text=self.tokens[-1])
+
+        app = web.Application()
+        app.router.add_get("/latest/meta-data/{field:.*}", handler)
+        app.router.add_put("/latest/api/token", token_handler)
+        server = TestServer(app)
+        await server.start_server()
+        return server
+
+    @staticmethod
+    def _aws_collector(server):
+        collector = AwsCollector()
+        collector.base_url = str(
+            server.make_url("/latest/meta-data/")) + "%s"
+        collector.token_url = str(server.make_url("/latest/api/token"))
+        return collector
+
+    async def test_aws_fields_fetched_concurrently(self):
+        server = await self._imds_server({
+            "instance-id": "i-09dc9f5553f84a9ad",
+            "identity-credentials/ec2/info": json.dumps(
+                {"AccountId": "00000000000"}),
+            "local-ipv4": "172.31.24.6",
+            "instance-life-cycle": "spot",
+            "instance-type": "m6in.large",
+            "placement/availability-zone": "eu-central-1a",
+            "placement/region": "eu-central-1",
+        }, delays={"placement/region": 5})
+        collector = self._aws_collector(server)
+        collector.field_timeout = 0.5
+        try:
+            start = time.monotonic()
+            platform_meta = await collector.get_platform_meta()
+            duration = time.monotonic() - start
+        finally:
+            await server.close()
+        # 7 fields take 0.1s each when fetched one by one
+        self.assertLess(duration, 0.7)
+        self.assertEqual(platform_meta.instance_id, "i-09dc9f5553f84a9ad")
+        self.assertEqual(platform_meta.account_id, "00000000000")
+        self.assertEqual(platform_meta.instance_lc, InstanceLifeCycle.Spot)
+        self.assertEqual(platform_meta.availability_zone, "eu-central-1a")
+        # missing and timed out fields are left empty
+        self.assertEqual(platform_meta.public_ip, "")
+        self.assertEqual(platform_meta.instance_region, "")
+        self.assertIsNone(collector.session)
+
+    async def test_alibaba_public_ip_fallback(self):
+        server = await self._imds_server({
+            "instance-id": "i-gw8csaxjubfr17s2e1ip",
+            "eipv4": "2.2.2.2",
+        }, delay=0)
+        collector = AlibabaCollector()
+        collector.base_url = str(
+            server.make_url("/latest/meta-data/")) + "%s"
+        try:
+            platform_meta = await collector.get_platform_meta()
+        finally:
+            await server.close()
+        self.assertEqual(platform_meta.instance_id, "i-gw8csaxjubfr17s2e1ip")
+        self.assertEqual(platform_meta.public_ip, "2.2.2.2")
+        self.assertEqual(platform_meta.instance_lc, InstanceLifeCycle.Unknown)
+        self.assertEqual(platform_meta.account_id, "")
+
+    async def test_aws_imds_v2_token_is_cached(self):
+        server = await self._imds_server({
+            "instance-id": "i-09dc9f5553f84a9ad",
+            "local-ipv4": "172.31.24.6",
+            "public-ipv4": "1.1.1.1",
+        }, delay=0, imds_v2=True)
+        try:
+            collector = self._aws_collector(server)
+            platform_meta = await collector.get_platform_meta()
+            await self._aws_collector(server).get_public_ip()
+            self.assertEqual(self.tokens, ["token-0"])
+
+            # token is refreshed before it expires
+            AwsCollector._token_expires_at = time.monotonic()
+            await collector.get_public_ip()
+            self.assertEqual(self.tokens, ["token-0", "token-1"])
+
+            # rejected token is refreshed once
+            self.tokens.append("token-2")
+            self.assertEqual(await collector.get_local_ip(), "172.31.24.6")
+            self.assertEqual(self.tokens[-1], "token-3")
+        finally:
+            await server.close()
+        self.assertEqual(platform_meta.instance_id, "i-09dc9f5553f84a9ad")
+        self.assertEqual(platform_meta.public_ip, "1.1.1.1")
@@ -0,0 +1,86 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from optscale_arcee.collectors.process_tree import ProcessTree
+
+
+def _busy(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "Linux only")
+class TestProcessTree(unittest.TestCase):
+    def _children(self):
+        worker = multiprocessing.get_context("fork").Process(
+            target=_busy, args=(0.5,))
+        worker.start()
+        self.addCleanup(worker.join)
+        sleeper = subprocess.Popen(["sleep", "30"])
+        self.addCleanup(sleeper.wait)
+        self.addCleanup(sleeper.kill)
+        return worker, sleeper
+
+    def test_tree(self):
+        tree = ProcessTree()
+        tree.sample()
+        worker, sleeper = self._children()
+        time.sleep(0.3)
+        stats = tree.sample(cpu_count=1)
+        roles = stats["roles"]
+        self.assertEqual(
+            {role: totals["count"] for role, totals in roles.items()},
+            {"main": 1, "worker": 1, "subprocess": 1})
+        self.assertEqual(stats["count"], 3)
+        # the worker is busy all the time
+        self.assertGreater(roles["worker"]["cpu"], 30)
+        self.assertGreater(roles["subprocess"]["rss"], 0)
+        self.assertEqual(stats["rss"],
+                         sum(totals["rss"] for totals in roles.values()))
+        worker.join()
+        sleeper.kill()
+        sleeper.wait()
+        stats = tree.sample()
+        self.assertEqual(stats["count"], 1)
+
+    def test_process_table_scan(self):
+        tree = ProcessTree()
+        tree._children_files = False
+        with patch.object(ProcessTree, "discovery_interval", 60):
+            tree.sample()
+            self._children()
+            # children started after the scan are found on the next one
+            self.assertEqual(tree.sample()["count"], 1)
+            tree._discovered_at = None
+            self.assertEqual(tree.sample()["count"], 3)
+
+    def test_no_children_files(self):
+        with tempfile.TemporaryDirectory() as root:
+            # the task directory exists without children files
+            os.makedirs(os.path.join(root, str(os.getpid()), "task",
+                                     str(os.getpid())))
+            tree = ProcessTree(procfs_root=root)
+            self.assertFalse(tree._children_files)
+            with open(os.path.join(root, str(os.getpid()), "task",
+                                   str(os.getpid()), "children"), "w"):
+                pass
+            tree = ProcessTree(procfs_root=root)
+            self.assertTrue(tree._children_files)
+
+    def test_main_process_from_reader(self):
+        reader = MagicMock()
+        reader.process_memory.return_value = (300, 100)
+        reader.process_cpu_time.side_effect = [1.0, 1.5]
+        tree = ProcessTree(reader=reader)
+        with patch("time.monotonic", side_effect=[10, 11]):
+            tree.sample(cpu_count=1)
+            main = tree.sample(cpu_count=1)["roles"]["main"]
+        self.assertEqual(main, {"count": 1, "rss": 100, "vms": 300,
+                                "cpu": 50.0})
@@ -0,0 +1,66 @@
+import unittest
+from unittest.mock import patch
+
+import aiohttp
+
+from optscale_arcee.sender.retry import CircuitBreaker, RetryPolicy
+
+
+def response_error(status):
+    return aiohttp.ClientResponseError(None, (), status=status)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_delay_is_bounded(self):
+        policy = RetryPolicy(base_delay=1, max_delay=5)
+        for attempt in range(1, 10):
+            delay = policy.delay(attempt)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(5, 2 ** (attempt - 1)))
+
+    def test_classification(self):
+        policy = RetryPolicy()
+        run = "https://optscale/arcee/v2/run/1"
+        collect = "https://optscale/arcee/v2/collect"
+        proc = "https://optscale/arcee/v2/run/1/proc"
+        self.assertTrue(
+            policy.is_retryable("PATCH", run, response_error(500)))
+        self.assertTrue(
+            policy.is_retryable("POST", proc, response_error(502)))
+        self.assertTrue(
+            policy.is_retryable("POST", collect, response_error(503)))
+        # server may have stored the metric already
+        self.assertFalse(
+            policy.is_retryable("POST", collect, response_error(500)))
+        self.assertFalse(
+            policy.is_retryable("POST", collect,
+                                aiohttp.ServerDisconnectedError()))
+        self.assertFalse(
+            policy.is_retryable("PATCH", run, response_error(404)))
+        self.assertTrue(policy.is_failure(response_error(429)))
+        self.assertFalse(policy.is_failure(response_error(401)))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    @patch("optscale_arcee.sender.retry.time.monotonic")
+    def test_open_and_reset(self, m_monotonic):
+        m_monotonic.return_value = 100
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        self.assertFalse(breaker.allow())
+
+        # single trial request after reset timeout
+        m_monotonic.return_value = 110
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        m_monotonic.return_value = 120
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow())
@@ -0,0 +1,71 @@
+import math
+import time
+import unittest
+
+from optscale_arcee.collectors.sampler import RingBuffer, Sampler, _flatten
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_summary(self):
+        buffer = RingBuffer(100)
+        for i in range(1, 101):
+            buffer.append({"rss": i})
+        self.assertEqual(buffer.summary(), {"rss": {
+            "min": 1, "max": 100, "mean": 50.5, "p50": 50, "p95": 95,
+            "last": 100}})
+
+    def test_oldest_samples_are_overwritten(self):
+        buffer = RingBuffer(3)
+        for i in range(5):
+            buffer.append({"cpu": i})
+        self.assertEqual(len(buffer), 3)
+        summary = buffer.summary()["cpu"]
+        self.assertEqual((summary["min"], summary["last"]), (2, 4))
+        buffer.clear()
+        self.assertEqual(buffer.summary(), {})
+
+    def test_missing_metrics(self):
+        buffer = RingBuffer(4)
+        buffer.append({"cpu": 1})
+        buffer.append({"cpu": 3, "gpu": 7})
+        buffer.append({"cpu": 2})
+        summary = buffer.summary()
+        self.assertEqual(summary["cpu"]["last"], 2)
+        self.assertEqual(summary["gpu"]["min"], 7)
+        self.assertEqual(summary["gpu"]["last"], 7)
+
+    def test_flatten(self):
+        self.assertEqual(_flatten({
+            "ps_stats": {"cpu_percent": 5.5, "load_average": [1, 2, 3]},
+            "proc": {"mem": {"rss": {"p": "0.1", "t": 10}}},
+            "gpu_stats": {"avg_gpu_load": 50.0, "gpus": {
+                "index": [0, 3], "uuid": ["GPU-0", "GPU-3"],
+                "load": [0.0, 100.0], "power": [None, 250.5]}},
+            "inf": math.inf,
+            "flag": True,
+        }), {"ps_stats.cpu_percent": 5.5, "proc.mem.rss.t": 10,
+             "gpu_stats.avg_gpu_load": 50.0,
+             # per-device values are keyed by device index
+             "gpu_stats.gpus.load.0": 0.0, "gpu_stats.gpus.load.3": 100.0,
+             "gpu_stats.gpus.power.3": 250.5,
+             "inf": math.inf})
+
+
+class TestSampler(unittest.TestCase):
+    def test_report_aggregates_window(self):
+        values = iter(range(1000))
+        sampler = Sampler(
+            interval=0.01, collect=lambda: {"proc": {"rss": next(values)}})
+        self.assertIsNone(sampler.report())
+        sampler.start()
+        try:
+            time.sleep(0.2)
+        finally:
+            sampler.stop()
+        report = sampler.report()
+        aggregates = report["aggregates"]["proc.rss"]
+        self.assertEqual(report["proc"]["rss"], aggregates["last"])
+        self.assertEqual(aggregates["min"], 0)
+        self.assertGreater(aggregates["max"], 5)
+        # a new window is started
+        self.assertEqual(sampler.report()["aggregates"], {})
@@ -0,0 +1,345 @@
+import asyncio
+import os
+import tempfile
+from unittest.mock import patch
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from aiounittest import AsyncTestCase
+
+from optscale_arcee.collectors import console
+from optscale_arcee.collectors.console import WritesCollector
+from optscale_arcee.platform import (
+    AwsCollector, InstanceLifeCycle, PlatformMeta, PlatformType)
+from optscale_arcee.sender.retry import (
+    CircuitBreaker, CircuitOpenError, RetryPolicy)
+from optscale_arcee.sender.sender import Sender
+from optscale_arcee.sender.spool import Spool
+
+
+class TestSender(AsyncTestCase):
+    @staticmethod
+    async def _server(handler):
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", handler)
+        server = TestServer(app)
+        await server.start_server()
+        return server
+
+    async def test_session_is_reused(self):
+        peers = set()
+
+        async def handler(request):
+            peers.add(request.transport.get_extra_info("peername"))
+            return web.json_response({"id": "run"})
+
+        server = await self._server(handler)
+        sender = Sender(str(server.make_url("")))
+        try:
+            for _ in range(3):
+                await sender.send_post_request(
+                    str(server.make_url("/collect")), data={})
+            session = sender._session()
+            await sender.patch_model_version("run", "model", "token", {})
+            self.assertIs(session, sender._session())
+        finally:
+            await sender.close()
+            await server.close()
+        # keep-alive connections are pooled, one TCP connection is used
+        self.assertEqual(len(peers), 1)
+        self.assertTrue(session.closed)
+        self.assertEqual(sender._sessions, {})
+
+    async def test_connection_limits(self):
+        sender = Sender(conn_limit=3, conn_limit_per_host=2)
+        session = sender._session()
+        self.assertEqual(session.connector.limit, 3)
+        self.assertEqual(session.connector.limit_per_host, 2)
+        await sender.close()
+
+    @patch("optscale_arcee.platform.AwsCollector.get_public_ip")
+    @patch("optscale_arcee.platform.AwsCollector.get_platform_meta")
+    @patch("optscale_arcee.platform.CollectorFactory.get")
+    async def test_platform_meta_is_cached(
+        self, m_factory, m_platform_meta, m_public_ip
+    ):
+        m_factory.return_value = AwsCollector
+        m_platform_meta.return_value = PlatformMeta(
+            PlatformType.aws, "i-1", public_ip="1.1.1.1",
+            instance_lc=InstanceLifeCycle.Spot)
+        m_public_ip.return_value = "2.2.2.2"
+        sender = Sender()
+        meta = await sender.platform_meta()
+        self.assertEqual(meta["public_ip"], "1.1.1.1")
+        self.assertEqual(meta["instance_lc"], "Spot")
+        self.assertIs(await sender.platform_meta(), meta)
+        await sender.m()
+        self.assertEqual(m_factory.call_count, 1)
+        self.assertEqual(m_platform_meta.call_count, 1)
+
+        meta = await sender.refresh_platform_meta()
+        self.assertEqual(meta["public_ip"], "2.2.2.2")
+        self.assertEqual(meta["instance_id"], "i-1")
+        self.assertEqual(m_platform_meta.call_count, 1)
+
+    async def test_spooled_requests_are_replayed(self):
+        received = list()
+        available = False
+
+        async def handler(request):
+            if not available:
+                raise web.HTTPServiceUnavailable()
+            received.append((request.method, await request.json()))
+            tokens.add(request.headers.get("x-api-key"))
+            return web.json_response({})
+
+        tokens = set()
+        server = await self._server(handler)
+        with tempfile.TemporaryDirectory() as tmp:
+            spool_path = os.path.join(tmp, "spool")
+            sender = Sender(str(server.make_url("")),
+                            spool=Spool(spool_path),
+                            retry_policy=RetryPolicy(max_attempts=1))
+            sender.replay_interval = 0.01
+            try:
+                await sender.add_milestone("run", "secret", "first")
+                await sender.create_stage("run", "secret", "second")
+                self.assertEqual(received, [])
+                # the token isn't written to the spool
+                for directory, _, files in os.walk(spool_path):
+                    for name in files:
+                        with open(os.path.join(directory, name), "rb") as f:
+                            self.assertNotIn(b"secret", f.read())
+                self.assertIsNotNone(sender._replay_task)
+                available = True
+                await sender.change_state("run", "secret", 2)
+                # replayer sends records once endpoint is back
+                await sender.flush_spool(timeout=1)
+            finally:
+                await sender.close()
+                await server.close()
+            self.assertFalse(os.path.exists(spool_path))
+        self.assertEqual(received, [
+            ("POST", {"milestone": "first"}),
+            ("POST", {"stage": "second"}),
+            ("PATCH", {"state": 2, "finish": False}),
+        ])
+        self.assertEqual(tokens, {"secret"})
+
+    async def test_undecodable_response_does_not_block_spool(self):
+        received = list()
+
+        async def handler(request):
+            received.append(await request.json())
+            return web.Response(text="OK")
+
+        server = await self._server(handler)
+        with tempfile.TemporaryDirectory() as tmp:
+            sender = Sender(str(server.make_url("")),
+                            spool=Spool(os.path.join(tmp, "spool")))
+            try:
+                await sender.add_milestone("run", "token", "first")
+                await sender.add_milestone("run", "token", "second")
+                self.assertTrue(sender.spool.empty())
+            finally:
+                await sender.close()
+                await server.close()
+        self.assertEqual(received, [
+            {"milestone": "first"}, {"milestone": "second"}])
+
+    async def test_transient_failures_are_retried(self):
+        statuses = [503, 200]
+        received = list()
+
+        async def handler(request):
+            received.append(request.path)
+            status = statuses.pop(0) if statuses else 500
+            return web.json_response({}, status=status)
+
+        server = await self._server(handler)
+        sender = Sender(str(server.make_url("")),
+                        retry_policy=RetryPolicy(max_attempts=2,
+                                                 base_delay=0.01),
+                        circuit_breaker=CircuitBreaker(failure_threshold=3))
+        try:
+            await sender.change_state("run", "token", 2)
+            self.assertEqual(len(received), 2)
+            # non idempotent request isn't repeated after server error
+            with self.assertRaises(aiohttp.ClientResponseError):
+                await sender.send_stats("token", {"data": {}})
+            self.assertEqual(len(received), 3)
+            with self.assertRaises(aiohttp.ClientResponseError):
+                await sender.change_state("run", "token", 2)
+            # breaker is open, requests fail fast
+            with self.assertRaises(CircuitOpenError):
+                await sender.change_state("run", "token", 2)
+            self.assertEqual(len(received), 5)
+        finally:
+            await sender.close()
+            await server.close()
+
+    async def test_request_compression(self):
+        received = list()
+
+        async def handler(request):
+            # aiohttp server decompresses request bodies
+            received.append((request.headers.get("Content-Encoding"),
+                             await request.json()))
+            return web.json_response({})
+
+        server = await self._server(handler)
+        sender = Sender(str(server.make_url("")), compression="gzip")
+        percpu = [12.25] * 192
+        try:
+            await sender.add_milestone("run", "token", "small")
+            await sender.send_patch_request(
+                str(server.make_url("/run")),
+                data={"tags": {"percpu": percpu}})
+        finally:
+            await sender.close()
+            await server.close()
+        self.assertEqual(received, [
+            (None, {"milestone": "small"}),
+            ("gzip", {"tags": {"percpu": percpu}}),
+        ])
+        # compression is enabled explicitly
+        self.assertIsNone(Sender().compression)
+
+    async def test_compression_is_negotiated(self):
+        received = list()
+
+        async def handler(request):
+            if request.headers.get("Content-Encoding"):
+                raise web.HTTPUnsupportedMediaType()
+            received.append(await request.json())
+            return web.json_response({})
+
+        server = await self._server(handler)
+        sender = Sender(str(server.make_url("")), compression="deflate")
+        sender.compress_threshold = 0
+        try:
+            await sender.add_milestone("run", "token", "first")
+            self.assertIsNone(sender._compress)
+            await sender.add_milestone("run", "token", "second")
+        finally:
+            await sender.close()
+            await server.close()
+        self.assertEqual(received, [
+            {"milestone": "first"}, {"milestone": "second"}])
+
+    async def test_patches_are_coalesced(self):
+        received = list()
+
+        async def handler(request):
+            received.append((request.path, await request.json()))
+            return web.json_response({})
+
+        server = await self._server(handler)
+        sender = Sender(str(server.make_url("")))
+        sender.patches.debounce = 0.05
+        tags = dict()
+        try:
+            for i in range(3):
+                tags["tag%s" % i] = i
+                await sender.add_tags("run", "token", dict(tags))
+                await sender.add_hyperparams("run", "token", {"lr": i})
+            await sender.add_version_tags("run", "model", "token", {"k": 1})
+            await sender.add_version_aliases("run", "model", "token", ["a"])
+            self.assertEqual(received, [])
+            await asyncio.sleep(0.2)
+            self.assertEqual(len(received), 2)
+            # lifecycle events send pending updates first
+            await sender.add_tags("run", "token", {"final": True})
+            await sender.create_stage("run", "token", "test")
+        finally:
+            await sender.close()
+            await server.close()
+        self.assertEqual(received, [
+            ("/run/run", {"tags": tags, "hyperparameters": {"lr": 2}}),
+            ("/runs/run/models/model/version",
+             {"tags": {"k": 1}, "aliases": ["a"]}),
+            ("/run/run", {"tags": {"final": True}}),
+            ("/run/run/stages", {"stage": "test"}),
+        ])
+
+    async def test_slow_run_metadata_is_sent_later(self):
+        received = list()
+
+        async def handler(request):
+            body = await request.json()
+            received.append((request.method, request.path, body))
+            if "imports" in body:
+                # the endpoint doesn't accept the field in updates
+                raise web.HTTPBadRequest()
+            return web.json_response({"id": "run"})
+
+        async def slow_imports():
+            await asyncio.sleep(0.3)
+            return ["numpy"]
+
+        async def import_versions():
+            return {"numpy": "1.26.4"}
+
+        async def git():
+            return {"branch": "main"}
+
+        async def command():
+            raise OSError("no access")
+
+        server = await self._server(handler)
+        sender = Sender(str(server.make_url("")))
+        sender.metadata_timeouts = {
+            "imports": 0.1, "import_versions": 1, "git": 1, "command": 1}
+        # tags are still pending when imports are collected
+        sender.patches.debounce = 0.5
+        try:
+            with patch.object(sender, "_imports_data", slow_imports), \
+                    patch.object(sender, "_import_versions_data",
+                                 import_versions), \
+                    patch.object(sender, "_git_data", git), \
+                    patch.object(sender, "_self_command", command):
+                started_at = asyncio.get_running_loop().time()
+                result = await sender.get_run_id("key", "token", "name")
+                elapsed = asyncio.get_running_loop().time() - started_at
+                self.assertEqual(result, {"id": "run"})
+                self.assertLess(elapsed, 0.3)
+                await sender.add_tags("run", "token", {"k": "v"})
+                await asyncio.sleep(0.5)
+        finally:
+            await sender.close()
+            await server.close()
+        self.assertEqual(received, [
+            ("POST", "/tasks/key/run",
+             {"git": {"branch": "main"}, "name": "name"}),
+            # optional fields are sent with their own update
+            ("PATCH", "/run/run", {"import_versions": {"numpy": "1.26.4"}}),
+            ("PATCH", "/run/run", {"imports": ["numpy"]}),
+            # late fields aren't merged with tags
+            ("PATCH", "/run/run", {"tags": {"k": "v"}}),
+        ])
+
+    async def test_console_is_streamed(self):
+        received = list()
+
+        async def handler(request):
+            received.append((request.headers.get("Content-Encoding"),
+                             request.headers.get("Transfer-Encoding"),
+                             await request.json()))
+            return web.json_response({})
+
+        stdout, stderr = WritesCollector(None), WritesCollector(None)
+        stdout.stream.chunk_size = 7
+        stdout.stream.write("epoch 1 ✔\n" * 10)
+        stderr.stream.write('"warning"\n')
+        server = await self._server(handler)
+        sender = Sender(str(server.make_url("")), compression="gzip")
+        try:
+            with patch.object(console, "stdout_writes", stdout), \
+                    patch.object(console, "stderr_writes", stderr):
+                await sender.send_console("run", "token")
+        finally:
+            await sender.close()
+            await server.close()
+        self.assertEqual(received, [("gzip", "chunked", {
+            "output": "epoch 1 ✔\n" * 10, "error": '"warning"\n'})])
@@ -0,0 +1,95 @@
+import json
+import math
+import unittest
+from unittest.mock import patch
+
+from optscale_arcee import serializer
+from optscale_arcee.platform import InstanceLifeCycle
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class FakeTensor:
+    """
+    Mimics torch.Tensor interface used by the serializer
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+    def detach(self):
+        return self
+
+    def cpu(self):
+        return self
+
+    def dim(self):
+        return 0 if not isinstance(self.value, list) else 1
+
+    def item(self):
+        return self.value
+
+    def numpy(self):
+        return self.value
+
+
+class TestSerializer(unittest.TestCase):
+    def _check_encoders(self, obj, expected):
+        # nan isn't equal to itself, values are compared as json
+        def dumped(value):
+            return json.dumps(value, sort_keys=True)
+
+        default_encoded = serializer.dumps(obj)
+        self.assertEqual(dumped(json.loads(default_encoded)),
+                         dumped(expected))
+        self.assertEqual(dumped(serializer.loads(default_encoded)),
+                         dumped(expected))
+        with patch("optscale_arcee.serializer.orjson", None):
+            encoded = serializer.dumps(obj)
+            self.assertIsInstance(encoded, bytes)
+            self.assertEqual(dumped(json.loads(encoded)), dumped(expected))
+            self.assertEqual(dumped(serializer.loads(encoded)),
+                             dumped(expected))
+        # both encoders produce the same output
+        self.assertEqual(default_encoded, encoded)
+
+    def test_builtin_types(self):
+        self._check_encoders(
+            {"loss": 0.25, "epoch": 1, "tags": ["a"], 1: None},
+            {"loss": 0.25, "epoch": 1, "tags": ["a"], "1": None})
+
+    def test_enum_and_tensors(self):
+        self._check_encoders({
+            "lc": InstanceLifeCycle.Spot,
+            "loss": FakeTensor(0.5),
+            "weights": FakeTensor([1, 2]),
+        }, {"lc": "Spot", "loss": 0.5, "weights": [1, 2]})
+
+    def test_non_finite_floats(self):
+        obj = {"loss": math.nan, "max": math.inf, "min": -math.inf,
+               "none": None, "tensor": FakeTensor([math.nan, 1.0])}
+        self._check_encoders(obj, {
+            "loss": None, "max": None, "min": None, "none": None,
+            "tensor": [None, 1.0]})
+        self.assertEqual(
+            serializer.dumps({"loss": math.nan}), b'{"loss":null}')
+
+    def test_unsupported_type(self):
+        with self.assertRaises(TypeError):
+            serializer.dumps({"obj": object()})
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy(self):
+        self._check_encoders({
+            "acc": numpy.float32(0.5),
+            "step": numpy.int64(3),
+            "hist": numpy.arange(4),
+            "half": numpy.ones(2, dtype=numpy.float16),
+            "column": numpy.arange(6).reshape(3, 2)[:, 0],
+        }, {
+            "acc": 0.5, "step": 3, "hist": [0, 1, 2, 3], "half": [1.0, 1.0],
+            "column": [0, 2, 4],
+        })
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+
+from optscale_arcee.sender.spool import Spool
+
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "spool")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @staticmethod
+    def _drain(spool):
+        records = list()
+        while not spool.empty():
+            records.append(spool.peek())
+            spool.pop()
+        return records
+
+    def test_records_are_read_in_order(self):
+        spool = Spool(self.path, segment_size=64)
+        for i in range(10):
+            spool.append({"i": i})
+        self.assertEqual(spool.peek(), {"i": 0})
+        self.assertEqual(spool.peek(), {"i": 0})
+        self.assertEqual(self._drain(spool), [{"i": i} for i in range(10)])
+        # consumed segments are removed, except the one being written
+        self.assertEqual(len([f for f in os.listdir(self.path)
+                              if f.endswith(".seg")]), 1)
+        spool.close()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_pending_records_survive_reopen(self):
+        spool = Spool(self.path, segment_size=64)
+        for i in range(5):
+            spool.append({"i": i})
+        spool.pop()
+        spool.pop()
+        spool.close()
+        spool = Spool(self.path, segment_size=64)
+        spool.append({"i": 5})
+        self.assertEqual(self._drain(spool), [{"i": i} for i in range(2, 6)])
+
+    def test_corrupted_tail_is_skipped(self):
+        spool = Spool(self.path)
+        spool.append({"i": 0})
+        spool.append({"i": 1})
+        spool.close()
+        segment = os.path.join(self.path, os.listdir(self.path)[0])
+        with open(segment, "r+b") as f:
+            f.seek(-2, os.SEEK_END)
+            f.write(b"xx")
+        spool = Spool(self.path)
+        spool.append({"i": 2})
+        self.assertEqual(self._drain(spool), [{"i": 0}, {"i": 2}])
+
+    def test_size_limit_drops_oldest_segments(self):
+        spool = Spool(self.path, segment_size=100, max_size=300)
+        for i in range(50):
+            spool.append({"i": i})
+        records = self._drain(spool)
+        self.assertLess(len(records), 50)
+        self.assertEqual(records[-1], {"i": 49})
+        self.assertEqual(records, sorted(records, key=lambda r: r["i"]))
+
+    def test_files_are_private(self):
+        spool = Spool.create(self.path)
+        spool.append({"i": 0})
+        spool.peek()
+        spool.pop()
+        for directory, _, files in os.walk(self.path):
+            self.assertEqual(os.stat(directory).st_mode & 0o777, 0o700)
+            for name in files:
+                path = os.path.join(directory, name)
+                self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+        spool.close()
+
+    def test_spools_of_finished_processes_are_adopted(self):
+        orphan = Spool(os.path.join(self.tmp.name, "999999999"))
+        orphan.append({"i": 0})
+        orphan.close()
+        spool = Spool.create(self.tmp.name)
+        spool.append({"i": 1})
+        self.assertEqual(self._drain(spool), [{"i": 0}, {"i": 1}])
+        self.assertFalse(
+            os.path.exists(os.path.join(self.tmp.name, "999999999")))
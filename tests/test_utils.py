@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import unittest
+from concurrent.futures import Future
+
+from optscale_arcee.utils import LoopThread, RunQueue
+
+
+class TestLoopThread(unittest.TestCase):
+    def setUp(self):
+        self.loop_thread = LoopThread()
+        self.loop_thread.start()
+
+    def tearDown(self):
+        self.loop_thread.stop()
+
+    def test_single_loop_is_used(self):
+        async def get_loop():
+            return asyncio.get_running_loop()
+
+        future = self.loop_thread.submit(get_loop())
+        self.assertIsInstance(future, Future)
+        self.assertIs(future.result(), self.loop_thread.loop)
+        self.assertIs(self.loop_thread.run_sync(get_loop()),
+                      self.loop_thread.loop)
+
+    def test_run_sync_from_loop_thread(self):
+        async def nested():
+            return self.loop_thread.run_sync(asyncio.sleep(0))
+
+        with self.assertRaises(RuntimeError):
+            self.loop_thread.run_sync(nested())
+
+    def test_submit_to_stopped_loop(self):
+        self.loop_thread.stop()
+        with self.assertRaises(RuntimeError):
+            self.loop_thread.submit(asyncio.sleep(0))
+
+
+class TestRunQueue(unittest.TestCase):
+    def setUp(self):
+        self.loop_thread = LoopThread()
+        self.loop_thread.start()
+        self.queue = RunQueue(self.loop_thread)
+
+    def tearDown(self):
+        self.loop_thread.stop()
+
+    def test_calls_are_queued_until_run_is_created(self):
+        created = threading.Event()
+        calls = list()
+
+        async def create():
+            await self.loop_thread.loop.run_in_executor(None, created.wait)
+            return "run"
+
+        async def call(value, delay=0):
+            await asyncio.sleep(delay)
+            calls.append(value)
+            return value
+
+        self.queue.start(create())
+        futures = [self.queue.submit(call, 1, 0.05),
+                   self.queue.submit(call, 2)]
+        self.assertTrue(self.queue.pending)
+        self.assertEqual(calls, [])
+        created.set()
+        futures.append(self.queue.submit(call, 3))
+        self.assertEqual([f.result(5) for f in futures], [1, 2, 3])
+        self.assertFalse(self.queue.pending)
+        # calls are run in submission order
+        self.assertEqual(calls, [1, 2, 3])
+
+    def test_calls_are_skipped_if_run_is_not_created(self):
+        async def create():
+            raise ConnectionError("unavailable")
+
+        async def call():
+            raise AssertionError("must not be called")
+
+        with self.assertLogs("optscale_arcee.utils", "WARNING"):
+            self.queue.start(create())
+            future = self.queue.submit(call)
+            self.assertIsNone(future.result(5))
+        self.assertIsInstance(self.queue.created.exception(), ConnectionError)